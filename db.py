@@ -1,13 +1,17 @@
 from __future__ import annotations
 
+import calendar
 import hashlib
+from collections import defaultdict
 import os
 import sqlite3
 import shutil
 import sys
-from datetime import datetime
+from contextlib import closing, contextmanager
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator
 
 from db_diary import (
     count_pending_reminders_impl,
@@ -87,16 +91,101 @@ def _ensure_cfg_file(filename: str) -> Path:
 DEFAULT_DB_PATH = _ensure_cfg_file("timesheet.db")
 
 
+@lru_cache(maxsize=4096)
+def _parse_iso_date(value: str) -> date:
+    """'YYYY-MM-DD' -> date; memoizzata perché le stesse date di programmazione ricorrono a ogni refresh."""
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+# Etichette "id - cliente / commessa" e "id - commessa / attività" delle combo: unica definizione,
+# usata da tutte le query che le restituiscono.
+_PROJECT_LABEL_SQL = "p.id || ' - ' || c.name || ' / ' || p.name"
+_ACTIVITY_LABEL_SQL = "a.id || ' - ' || CASE WHEN p.name <> '' THEN p.name || ' / ' ELSE '' END || a.name"
+
+
 class Database:
+    # Query dei refresh UI tenute come costanti: a parità di filtri il testo SQL è identico,
+    # quindi la cache degli statement di sqlite3 riusa il piano già compilato.
+    _LIST_PROJECTS_SQL = f"""
+            SELECT p.id, p.client_id, p.name, p.hourly_rate, p.notes, p.referente_commessa, p.descrizione_commessa, p.closed,
+                   c.name AS client_name, c.referente AS client_referente, c.telefono AS client_telefono, c.email AS client_email,
+                   {_PROJECT_LABEL_SQL} AS display
+            FROM projects p
+            JOIN clients c ON c.id = p.client_id
+            {{joins}}
+            {{where}}
+            ORDER BY c.name, p.name
+            """
+    _LIST_ACTIVITIES_SQL = f"""
+            SELECT a.id, a.project_id, a.name, a.hourly_rate, a.notes, p.name AS project_name,
+                   {_ACTIVITY_LABEL_SQL} AS display
+            FROM activities a
+            JOIN projects p ON p.id = a.project_id
+            {{where}}
+            ORDER BY p.name, a.name
+            """
+    _LIST_SCHEDULES_SQL = f"""
+            SELECT s.id, s.project_id, s.activity_id, s.start_date, s.end_date, 
+                   s.planned_hours, s.note, s.budget, s.status,
+                   c.name AS client_name,
+                   p.name AS project_name,
+                   a.name AS activity_name,
+                   {_PROJECT_LABEL_SQL} AS project_display,
+                   {_ACTIVITY_LABEL_SQL} AS activity_display
+            FROM schedules s
+            JOIN projects p ON p.id = s.project_id
+            JOIN clients c ON c.id = p.client_id
+            LEFT JOIN activities a ON a.id = s.activity_id
+            {{where}}
+            ORDER BY s.start_date ASC, c.name, p.name
+            """
+    _LIST_TIMESHEETS_FOR_DAY_SQL = f"""
+            SELECT t.id, t.user_id, t.client_id, t.project_id, t.activity_id,
+                   t.work_date, t.hours, t.note, t.effective_rate, t.cost,
+                   u.username,
+                   c.name AS client_name,
+                   p.name AS project_name,
+                   a.name AS activity_name,
+                   c.id || ' - ' || c.name AS client_display,
+                   {_PROJECT_LABEL_SQL} AS project_display,
+                   {_ACTIVITY_LABEL_SQL} AS activity_display
+            FROM timesheets t
+            JOIN users u ON u.id = t.user_id
+            JOIN clients c ON c.id = t.client_id
+            JOIN projects p ON p.id = t.project_id
+            JOIN activities a ON a.id = t.activity_id
+            {{where}}
+            ORDER BY t.created_at DESC
+            """
+    _TIMESHEETS_FOR_DAY_ALL_SQL = _LIST_TIMESHEETS_FOR_DAY_SQL.format(where="WHERE t.work_date = ?")
+    _TIMESHEETS_FOR_DAY_USER_SQL = _LIST_TIMESHEETS_FOR_DAY_SQL.format(where="WHERE t.work_date = ? AND t.user_id = ?")
+    _SCHEDULES_ALL_SQL = _LIST_SCHEDULES_SQL.format(where="")
+    _SCHEDULES_OPEN_SQL = _LIST_SCHEDULES_SQL.format(where="WHERE s.status = 'aperta'")
+    _DELETE_USER_ASSIGNMENT_SQL = (
+        "DELETE FROM user_project_assignments WHERE user_id = ? AND project_id = ? AND activity_id IS ?"
+    )
+    _DELETE_ALL_ASSIGNMENTS_SQL = "DELETE FROM user_project_assignments WHERE project_id = ? AND activity_id IS ?"
+
     def __init__(self, db_path: str | Path = DEFAULT_DB_PATH) -> None:
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
-        self.conn = sqlite3.connect(self.db_path)
+        self.conn = sqlite3.connect(self.db_path, cached_statements=256)
         self.conn.row_factory = sqlite3.Row
+        self._transaction_depth = 0
         self.conn.execute("PRAGMA foreign_keys = ON;")
+        self._apply_pragmas()
         self._create_schema()
         self._seed_admin()
 
+    def _apply_pragmas(self) -> None:
+        """WAL e cache: letture UI non bloccate dal backup e meno fsync per ogni commit."""
+        self.conn.execute("PRAGMA journal_mode = WAL;")
+        self.conn.execute("PRAGMA synchronous = NORMAL;")
+        self.conn.execute("PRAGMA temp_store = MEMORY;")
+        self.conn.execute("PRAGMA cache_size = -65536;")
+        self.conn.execute("PRAGMA busy_timeout = 5000;")
+        self.conn.execute("PRAGMA mmap_size = 268435456;")
+
     def close(self) -> None:
         self.conn.close()
 
@@ -107,8 +196,10 @@ class Database:
         BACKUP_DIR.mkdir(parents=True, exist_ok=True)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         backup_path = BACKUP_DIR / f"{self.db_path.stem}_{timestamp}.db"
-        with sqlite3.connect(backup_path) as backup_conn:
-            self.conn.backup(backup_conn)
+        # Connessioni dedicate e chiuse a fine copia: il backup può girare anche da un thread
+        # diverso da quello che possiede self.conn.
+        with closing(sqlite3.connect(self.db_path)) as source_conn, closing(sqlite3.connect(backup_path)) as backup_conn:
+            source_conn.backup(backup_conn)
         self._cleanup_backups()
         return backup_path
 
@@ -129,6 +220,7 @@ class Database:
         return hashlib.sha256(password.encode("utf-8")).hexdigest()
 
     @staticmethod
+    @lru_cache(maxsize=1024)
     def calculate_working_days(start_date_str: str, end_date_str: str) -> int:
         """Calcola i giorni lavorativi (esclusi sabato e domenica) tra due date.
         
@@ -143,10 +235,8 @@ class Database:
             return 0
         
         try:
-            from datetime import datetime, timedelta
-            
-            start = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-            end = datetime.strptime(end_date_str, "%Y-%m-%d").date()
+            start = _parse_iso_date(start_date_str)
+            end = _parse_iso_date(end_date_str)
             
             if start > end:
                 return 0
@@ -388,6 +478,18 @@ class Database:
         """)
         self.conn.commit()
 
+        # Indici per le ricerche più frequenti
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_schedules_project_activity ON schedules(project_id, activity_id, start_date)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_timesheets_date_user ON timesheets(work_date, user_id)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_upa_project_activity ON user_project_assignments(project_id, activity_id)"
+        )
+        self.conn.commit()
+
     def _seed_admin(self) -> None:
         row = self.conn.execute("SELECT id FROM users LIMIT 1").fetchone()
         if row:
@@ -402,13 +504,64 @@ class Database:
         )
         self.conn.commit()
 
+    @contextmanager
+    def read_batch(self) -> Iterator[None]:
+        """Esegue una raffica di letture dentro un'unica transazione (un solo lock e snapshot)."""
+        if self.conn.in_transaction:
+            yield
+            return
+        self.conn.execute("BEGIN")
+        try:
+            yield
+        finally:
+            if self.conn.in_transaction:
+                self.conn.commit()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Raggruppa più scritture in un unico commit; in caso di errore annulla tutto."""
+        self._transaction_depth += 1
+        try:
+            yield
+        except BaseException:
+            if self._transaction_depth == 1:
+                self.conn.rollback()
+            raise
+        else:
+            if self._transaction_depth == 1:
+                self.conn.commit()
+        finally:
+            self._transaction_depth -= 1
+
+    def _commit(self) -> None:
+        # Dentro transaction() il commit è rimandato alla chiusura del blocco.
+        if not self._transaction_depth:
+            self.conn.commit()
+
+    def change_token(self) -> tuple[int, int]:
+        """Valore che cambia a ogni modifica del database, da questa connessione o da altre.
+
+        Utile per invalidare cache lato UI: total_changes conta le scritture (cascate incluse)
+        di questa connessione, data_version cambia quando un'altra connessione fa commit.
+        """
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        return self.conn.total_changes, int(data_version)
+
+    def _plain_cursor(self, query: str, params: tuple[Any, ...]) -> tuple[sqlite3.Cursor, list[str]]:
+        """Cursore che restituisce tuple: i dict si costruiscono direttamente, senza passare da sqlite3.Row."""
+        cur = self.conn.cursor()
+        cur.row_factory = None
+        cur.execute(query, params)
+        return cur, [column[0] for column in cur.description]
+
     def _fetchall(self, query: str, params: tuple[Any, ...] = ()) -> list[dict[str, Any]]:
-        rows = self.conn.execute(query, params).fetchall()
-        return [dict(row) for row in rows]
+        cur, columns = self._plain_cursor(query, params)
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
 
     def _fetchone(self, query: str, params: tuple[Any, ...] = ()) -> dict[str, Any] | None:
-        row = self.conn.execute(query, params).fetchone()
-        return dict(row) if row else None
+        cur, columns = self._plain_cursor(query, params)
+        row = cur.fetchone()
+        return dict(zip(columns, row)) if row else None
 
     def authenticate(self, username: str, password: str) -> dict[str, Any] | None:
         return self._fetchone(
@@ -427,6 +580,13 @@ class Database:
         query += " ORDER BY username"
         return self._fetchall(query)
 
+    def get_user(self, user_id: int) -> dict[str, Any] | None:
+        """Restituisce un singolo utente (stesse colonne di list_users)."""
+        return self._fetchone(
+            "SELECT id, username, full_name, role, active, tab_calendar, tab_master, tab_plan, tab_control FROM users WHERE id = ?",
+            (user_id,),
+        )
+
     def create_user(
         self, 
         username: str, 
@@ -587,17 +747,12 @@ class Database:
         pass
     
     def remove_user_project_assignment(self, user_id: int | None, project_id: int, activity_id: int | None = None) -> None:
-        """Rimuove un'assegnazione utente-progetto-attività."""
-        if activity_id:
-            self.conn.execute(
-                "DELETE FROM user_project_assignments WHERE project_id = ? AND activity_id = ?",
-                (project_id, activity_id),
-            )
+        """Rimuove un'assegnazione utente-progetto-attività (user_id None = tutti gli utenti)."""
+        activity_id = activity_id or None
+        if user_id is not None:
+            self.conn.execute(self._DELETE_USER_ASSIGNMENT_SQL, (user_id, project_id, activity_id))
         else:
-            self.conn.execute(
-                "DELETE FROM user_project_assignments WHERE project_id = ? AND activity_id IS NULL",
-                (project_id,),
-            )
+            self.conn.execute(self._DELETE_ALL_ASSIGNMENTS_SQL, (project_id, activity_id))
         self.conn.commit()
     
     def get_user_project_assignments(self, project_id: int) -> list[dict[str, Any]]:
@@ -613,6 +768,19 @@ class Database:
             (project_id,),
         )
     
+    def get_activity_assignments(self, project_id: int, activity_id: int) -> list[dict[str, Any]]:
+        """Restituisce gli utenti assegnati a una specifica attività della commessa."""
+        return self._fetchall(
+            """
+            SELECT upa.user_id, upa.project_id, upa.activity_id, u.username, u.full_name
+            FROM user_project_assignments upa
+            JOIN users u ON u.id = upa.user_id
+            WHERE upa.project_id = ? AND upa.activity_id = ?
+            ORDER BY u.full_name
+            """,
+            (project_id, activity_id),
+        )
+
     def user_can_access_activity(self, user_id: int, project_id: int, activity_id: int) -> bool:
         """Verifica se un utente può accedere a un'attività (tramite assegnazione alla commessa)."""
         # Verifica che l'attività appartenga alla commessa
@@ -726,9 +894,10 @@ class Database:
     def get_project(self, project_id: int) -> dict[str, Any] | None:
         """Recupera un singolo progetto per ID."""
         rows = self._fetchall(
-            """
+            f"""
             SELECT p.id, p.client_id, p.name, p.hourly_rate, p.notes, p.referente_commessa, p.descrizione_commessa, p.closed,
-                   c.name AS client_name, c.referente AS client_referente, c.telefono AS client_telefono, c.email AS client_email
+                   c.name AS client_name, c.referente AS client_referente, c.telefono AS client_telefono, c.email AS client_email,
+                   {_PROJECT_LABEL_SQL} AS display
             FROM projects p
             JOIN clients c ON c.id = p.client_id
             WHERE p.id = ?
@@ -742,18 +911,31 @@ class Database:
             "INSERT INTO activities (project_id, name, hourly_rate, notes) VALUES (?, ?, ?, ?)",
             (project_id, name.strip(), hourly_rate, notes.strip()),
         )
-        self.conn.commit()
+        self._commit()
         return cursor.lastrowid
 
     def list_clients(self) -> list[dict[str, Any]]:
         return self._fetchall(
             """
-            SELECT id, name, hourly_rate, notes, referente, telefono, email
+            SELECT id, name, hourly_rate, notes, referente, telefono, email,
+                   id || ' - ' || name AS display
             FROM clients
             ORDER BY name
             """
         )
 
+    def get_client(self, client_id: int) -> dict[str, Any] | None:
+        """Restituisce un singolo cliente (stesse colonne di list_clients)."""
+        return self._fetchone(
+            """
+            SELECT id, name, hourly_rate, notes, referente, telefono, email,
+                   id || ' - ' || name AS display
+            FROM clients
+            WHERE id = ?
+            """,
+            (client_id,),
+        )
+
     def list_projects(self, client_id: int | None = None, only_with_open_schedules: bool = False, user_id: int | None = None, available_from_date: str | None = None) -> list[dict[str, Any]]:
         params: list[Any] = []
         where_clauses = []
@@ -784,18 +966,7 @@ class Database:
         if where_clauses:
             where = "WHERE " + " AND ".join(where_clauses)
 
-        return self._fetchall(
-            f"""
-            SELECT p.id, p.client_id, p.name, p.hourly_rate, p.notes, p.referente_commessa, p.descrizione_commessa, p.closed,
-                   c.name AS client_name, c.referente AS client_referente, c.telefono AS client_telefono, c.email AS client_email
-            FROM projects p
-            JOIN clients c ON c.id = p.client_id
-            {joins}
-            {where}
-            ORDER BY c.name, p.name
-            """,
-            tuple(params),
-        )
+        return self._fetchall(self._LIST_PROJECTS_SQL.format(joins=joins, where=where), tuple(params))
 
     def list_activities(self, project_id: int | None = None, only_with_open_schedules: bool = False, available_from_date: str | None = None) -> list[dict[str, Any]]:
         params: list[Any] = []
@@ -820,15 +991,58 @@ class Database:
         if where_clauses:
             where = "WHERE " + " AND ".join(where_clauses)
 
+        return self._fetchall(self._LIST_ACTIVITIES_SQL.format(where=where), tuple(params))
+
+    def list_projects_with_schedule(self, client_id: int, include_closed: bool = True) -> list[dict[str, Any]]:
+        """Commesse del cliente con la relativa programmazione di commessa (colonne schedule_*, NULL se assente).
+
+        Con include_closed=False le commesse chiuse (stato della programmazione o, in assenza, flag closed)
+        vengono escluse direttamente in SQL.
+        """
+        where = "WHERE p.client_id = ?"
+        if not include_closed:
+            where += """
+              AND NOT CASE WHEN s.id IS NOT NULL THEN COALESCE(s.status, 'aperta') = 'chiusa'
+                           ELSE COALESCE(p.closed, 0) <> 0 END"""
         return self._fetchall(
             f"""
-            SELECT a.id, a.project_id, a.name, a.hourly_rate, a.notes, p.name AS project_name
+            SELECT p.id, p.client_id, p.name, p.hourly_rate, p.notes, p.referente_commessa, p.descrizione_commessa, p.closed,
+                   c.name AS client_name,
+                   s.id AS schedule_id, s.start_date AS schedule_start_date, s.end_date AS schedule_end_date,
+                   s.planned_hours AS schedule_planned_hours, s.budget AS schedule_budget, s.status AS schedule_status
+            FROM projects p
+            JOIN clients c ON c.id = p.client_id
+            LEFT JOIN schedules s ON s.id = (
+                SELECT s2.id FROM schedules s2
+                WHERE s2.project_id = p.id AND s2.activity_id IS NULL
+                ORDER BY s2.start_date, s2.id
+                LIMIT 1
+            )
+            {where}
+            ORDER BY c.name, p.name
+            """,
+            (client_id,),
+        )
+
+    def list_activities_with_schedule(self, project_id: int) -> list[dict[str, Any]]:
+        """Attività della commessa con la relativa programmazione (colonne schedule_*, NULL se assente)."""
+        return self._fetchall(
+            """
+            SELECT a.id, a.project_id, a.name, a.hourly_rate, a.notes, p.name AS project_name,
+                   s.id AS schedule_id, s.start_date AS schedule_start_date, s.end_date AS schedule_end_date,
+                   s.planned_hours AS schedule_planned_hours, s.budget AS schedule_budget, s.status AS schedule_status
             FROM activities a
             JOIN projects p ON p.id = a.project_id
-            {where}
+            LEFT JOIN schedules s ON s.id = (
+                SELECT s2.id FROM schedules s2
+                WHERE s2.project_id = a.project_id AND s2.activity_id = a.id
+                ORDER BY s2.start_date, s2.id
+                LIMIT 1
+            )
+            WHERE a.project_id = ?
             ORDER BY p.name, a.name
             """,
-            tuple(params),
+            (project_id,),
         )
 
     def update_activity(self, activity_id: int, name: str, hourly_rate: float, notes: str = "") -> None:
@@ -836,7 +1050,7 @@ class Database:
             "UPDATE activities SET name = ?, hourly_rate = ?, notes = ? WHERE id = ?",
             (name.strip(), hourly_rate, notes.strip(), activity_id),
         )
-        self.conn.commit()
+        self._commit()
     
     def get_activity(self, activity_id: int) -> dict[str, Any] | None:
         """Restituisce i dati di un'attività specifica."""
@@ -950,36 +1164,17 @@ class Database:
         self.conn.commit()
 
     def list_timesheets_for_day(self, work_date: str, user_id: int | None = None) -> list[dict[str, Any]]:
-        params: list[Any] = [work_date]
-        where = "WHERE t.work_date = ?"
-        if user_id is not None:
-            where += " AND t.user_id = ?"
-            params.append(user_id)
-
-        return self._fetchall(
-            f"""
-            SELECT t.id, t.user_id, t.client_id, t.project_id, t.activity_id,
-                   t.work_date, t.hours, t.note, t.effective_rate, t.cost,
-                   u.username,
-                   c.name AS client_name,
-                   p.name AS project_name,
-                   a.name AS activity_name
-            FROM timesheets t
-            JOIN users u ON u.id = t.user_id
-            JOIN clients c ON c.id = t.client_id
-            JOIN projects p ON p.id = t.project_id
-            JOIN activities a ON a.id = t.activity_id
-            {where}
-            ORDER BY t.created_at DESC
-            """,
-            tuple(params),
-        )
+        if user_id is None:
+            return self._fetchall(self._TIMESHEETS_FOR_DAY_ALL_SQL, (work_date,))
+        return self._fetchall(self._TIMESHEETS_FOR_DAY_USER_SQL, (work_date, user_id))
 
     def get_month_hours_summary(self, year: int, month: int, user_id: int | None = None) -> dict[int, float]:
         """Restituisce un dizionario {giorno: ore_totali} per il mese specificato."""
-        year_month = f"{year:04d}-{month:02d}"
-        params: list[Any] = [year_month]
-        where = "WHERE substr(t.work_date, 1, 7) = ?"
+        # Intervallo esplicito sul mese: confronto diretto su work_date (nessuna funzione
+        # sulla colonna), così SQLite può usare un eventuale indice su work_date.
+        last_day = calendar.monthrange(year, month)[1]
+        params: list[Any] = [f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-{last_day:02d}"]
+        where = "WHERE t.work_date >= ? AND t.work_date <= ?"
         if user_id is not None:
             where += " AND t.user_id = ?"
             params.append(user_id)
@@ -1048,7 +1243,7 @@ class Database:
             """,
             (project_id, activity_id, start_date, end_date, planned_hours, note.strip(), budget),
         )
-        self.conn.commit()
+        self._commit()
 
     def update_schedule(
         self,
@@ -1077,11 +1272,11 @@ class Database:
             """,
             (project_id, activity_id, start_date, end_date, planned_hours, note.strip(), budget, schedule_id),
         )
-        self.conn.commit()
+        self._commit()
 
     def delete_schedule(self, schedule_id: int) -> None:
         self.conn.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,))
-        self.conn.commit()
+        self._commit()
     
     def update_schedule_status(self, schedule_id: int, status: str) -> None:
         """Aggiorna lo status di una schedulazione (aperta/chiusa)."""
@@ -1099,21 +1294,32 @@ class Database:
         Args:
             only_open: Se True, filtra solo le schedule con status='aperta'
         """
-        where_clause = "WHERE s.status = 'aperta'" if only_open else ""
-        query = f"""
-            SELECT s.id, s.project_id, s.activity_id, s.start_date, s.end_date, 
-                   s.planned_hours, s.note, s.budget, s.status,
-                   c.name AS client_name,
-                   p.name AS project_name,
-                   a.name AS activity_name
-            FROM schedules s
-            JOIN projects p ON p.id = s.project_id
-            JOIN clients c ON c.id = p.client_id
-            LEFT JOIN activities a ON a.id = s.activity_id
-            {where_clause}
-            ORDER BY s.start_date ASC, c.name, p.name
-        """
-        return self._fetchall(query)
+        return self._fetchall(self._SCHEDULES_OPEN_SQL if only_open else self._SCHEDULES_ALL_SQL)
+
+    def get_activity_schedule_totals(self, project_id: int, exclude_activity_id: int | None = None) -> tuple[float, float]:
+        """Somma ore pianificate e budget delle programmazioni di attività della commessa (esclusa eventualmente una)."""
+        row = self.conn.execute(
+            """
+            SELECT COALESCE(SUM(planned_hours), 0), COALESCE(SUM(budget), 0)
+            FROM schedules
+            WHERE project_id = ? AND activity_id IS NOT NULL AND activity_id IS NOT ?
+            """,
+            (project_id, exclude_activity_id),
+        ).fetchone()
+        return float(row[0]), float(row[1])
+
+    def get_schedule_for(self, project_id: int, activity_id: int | None) -> dict[str, Any] | None:
+        """Prima programmazione (per data di inizio) della commessa o dell'attività indicata (activity_id None = commessa)."""
+        return self._fetchone(
+            """
+            SELECT id, project_id, activity_id, start_date, end_date, planned_hours, note, budget, status
+            FROM schedules
+            WHERE project_id = ? AND activity_id IS ?
+            ORDER BY start_date, id
+            LIMIT 1
+            """,
+            (project_id, activity_id),
+        )
 
     def get_schedule_control_data(self) -> list[dict[str, Any]]:
         """Calcola per ogni programmazione: ore pianificate, ore svolte, ore mancanti, giorni mancanti, budget e costi effettivi."""
@@ -1186,7 +1392,6 @@ class Database:
             remaining_budget = budget - actual_cost
             
             # Calcola giorni mancanti (end_date - oggi)
-            from datetime import datetime, date
             try:
                 end_date = datetime.strptime(schedule["end_date"], "%Y-%m-%d").date()
                 today = date.today()
@@ -1217,8 +1422,6 @@ class Database:
 
     def get_hierarchical_timesheet_data(self) -> list[dict[str, Any]]:
         """Recupera tutti i dati organizzati gerarchicamente con pianificazione: Cliente > Commessa > Attività > Inserimenti."""
-        from datetime import datetime, date
-        
         # Recupera tutti i clienti che hanno progetti con schedules O timesheet
         clients = self._fetchall(
             """
@@ -1234,48 +1437,89 @@ class Database:
         
         result = []
         today = date.today()
-        
-        for client in clients:
-            # Recupera tutte le commesse del cliente con schedules O timesheet
-            projects = self._fetchall(
+
+        # Programmazioni lette una sola volta e indicizzate per commessa (livello progetto) e per
+        # (commessa, attività): a parità di chiave vale quella con data fine più recente, come nelle
+        # precedenti query "ORDER BY end_date DESC LIMIT 1" eseguite per ogni nodo.
+        project_schedules: dict[int, dict[str, Any]] = {}
+        activity_schedules: dict[tuple[int, int], dict[str, Any]] = {}
+        for schedule in self._fetchall(
+            """
+            SELECT id, project_id, activity_id, start_date, end_date, planned_hours, budget, status, note
+            FROM schedules
+            ORDER BY end_date DESC, start_date, id
+            """
+        ):
+            if schedule["activity_id"] is None:
+                project_schedules.setdefault(schedule["project_id"], schedule)
+            else:
+                activity_schedules.setdefault((schedule["project_id"], schedule["activity_id"]), schedule)
+
+        # Commesse, attività e inserimenti letti con una query ciascuno e raggruppati per nodo padre
+        # (prima: una query per cliente, una per commessa e una per attività).
+        projects_by_client: dict[int, list[dict[str, Any]]] = defaultdict(list)
+        for project in self._fetchall(
+            """
+            SELECT p.id, p.client_id, p.name, p.hourly_rate
+            FROM projects p
+            WHERE EXISTS (SELECT 1 FROM schedules s WHERE s.project_id = p.id)
+               OR EXISTS (SELECT 1 FROM timesheets t WHERE t.project_id = p.id)
+            ORDER BY p.name
+            """
+        ):
+            projects_by_client[project.pop("client_id")].append(project)
+
+        activities_by_project: dict[int, list[dict[str, Any]]] = defaultdict(list)
+        for activity in self._fetchall(
+            """
+            SELECT x.project_id, a.id, a.name, a.hourly_rate
+            FROM (
+                SELECT project_id, activity_id FROM schedules WHERE activity_id IS NOT NULL
+                UNION
+                SELECT project_id, activity_id FROM timesheets
+            ) x
+            JOIN activities a ON a.id = x.activity_id
+            ORDER BY a.name
+            """
+        ):
+            activities_by_project[activity.pop("project_id")].append(activity)
+
+        timesheets_by_activity: dict[tuple[int, int], list[dict[str, Any]]] = defaultdict(list)
+        for entry in self._fetchall(
+            """
+            SELECT t.project_id, t.activity_id,
+                   t.id, t.work_date, t.hours, t.cost, t.note,
+                   u.username, u.full_name
+            FROM timesheets t
+            JOIN users u ON u.id = t.user_id
+            ORDER BY t.work_date DESC
+            """
+        ):
+            timesheets_by_activity[(entry.pop("project_id"), entry.pop("activity_id"))].append(entry)
+
+        project_totals = {
+            row["project_id"]: row
+            for row in self._fetchall(
+                """
+                SELECT project_id, COALESCE(SUM(hours), 0) AS total_hours, COALESCE(SUM(cost), 0) AS total_cost
+                FROM timesheets
+                GROUP BY project_id
                 """
-                SELECT DISTINCT p.id, p.name, p.hourly_rate
-                FROM projects p
-                LEFT JOIN schedules s ON s.project_id = p.id
-                LEFT JOIN timesheets t ON t.project_id = p.id
-                WHERE p.client_id = ? AND (s.id IS NOT NULL OR t.id IS NOT NULL)
-                ORDER BY p.name
-                """,
-                (client["id"],)
             )
+        }
+        
+        for client in clients:
+            # Commesse del cliente con schedules O timesheet
+            projects = projects_by_client.get(client["id"], [])
             
             projects_data = []
             
             for project in projects:
                 # Verifica se esiste una schedule a livello progetto (senza activity_id)
-                project_schedule = self._fetchone(
-                    """
-                    SELECT id, start_date, end_date, planned_hours, budget, status, note
-                    FROM schedules
-                    WHERE project_id = ? AND activity_id IS NULL
-                    ORDER BY end_date DESC
-                    LIMIT 1
-                    """,
-                    (project["id"],)
-                )
+                project_schedule = project_schedules.get(project["id"])
                 
-                # Recupera le attività con schedules O timesheet per questo progetto
-                activities = self._fetchall(
-                    """
-                    SELECT DISTINCT a.id, a.name, a.hourly_rate
-                    FROM activities a
-                    LEFT JOIN schedules s ON s.activity_id = a.id AND s.project_id = ?
-                    LEFT JOIN timesheets t ON t.activity_id = a.id AND t.project_id = ?
-                    WHERE (s.id IS NOT NULL OR t.id IS NOT NULL)
-                    ORDER BY a.name
-                    """,
-                    (project["id"], project["id"])
-                )
+                # Attività con schedules O timesheet per questo progetto
+                activities = activities_by_project.get(project["id"], [])
                 
                 activities_data = []
                 project_planned_hours = 0.0
@@ -1292,44 +1536,18 @@ class Database:
                     project_start_date = project_schedule["start_date"]
                     project_end_date = project_schedule["end_date"]
                     
-                    # Recupera timesheet per l'intero progetto
-                    timesheets_summary = self._fetchone(
-                        """
-                        SELECT COALESCE(SUM(hours), 0) AS total_hours,
-                               COALESCE(SUM(cost), 0) AS total_cost
-                        FROM timesheets
-                        WHERE project_id = ?
-                        """,
-                        (project["id"],)
-                    )
-                    project_actual_hours = float(timesheets_summary["total_hours"])
-                    project_actual_cost = float(timesheets_summary["total_cost"])
+                    # Totali timesheet per l'intero progetto
+                    timesheets_summary = project_totals.get(project["id"])
+                    if timesheets_summary:
+                        project_actual_hours = float(timesheets_summary["total_hours"])
+                        project_actual_cost = float(timesheets_summary["total_cost"])
                 
                 for activity in activities:
                     # Recupera schedule per l'attività
-                    activity_schedule = self._fetchone(
-                        """
-                        SELECT id, start_date, end_date, planned_hours, budget, status, note
-                        FROM schedules
-                        WHERE project_id = ? AND activity_id = ?
-                        ORDER BY end_date DESC
-                        LIMIT 1
-                        """,
-                        (project["id"], activity["id"])
-                    )
+                    activity_schedule = activity_schedules.get((project["id"], activity["id"]))
                     
-                    # Recupera timesheet per l'attività
-                    timesheets = self._fetchall(
-                        """
-                        SELECT t.id, t.work_date, t.hours, t.cost, t.note,
-                               u.username, u.full_name
-                        FROM timesheets t
-                        JOIN users u ON u.id = t.user_id
-                        WHERE t.project_id = ? AND t.activity_id = ?
-                        ORDER BY t.work_date DESC
-                        """,
-                        (project["id"], activity["id"])
-                    )
+                    # Timesheet dell'attività
+                    timesheets = timesheets_by_activity.get((project["id"], activity["id"]), [])
                     
                     activity_actual_hours = sum(float(ts["hours"]) for ts in timesheets)
                     activity_actual_cost = sum(float(ts["cost"]) for ts in timesheets)
@@ -1354,7 +1572,7 @@ class Database:
                         
                         # Calcola giorni restanti
                         try:
-                            end_date = datetime.strptime(activity_schedule["end_date"], "%Y-%m-%d").date()
+                            end_date = _parse_iso_date(activity_schedule["end_date"])
                             activity_data["remaining_days"] = (end_date - today).days
                         except:
                             activity_data["remaining_days"] = 0
@@ -1408,7 +1626,7 @@ class Database:
                 project_remaining_days = 0
                 if project_end_date:
                     try:
-                        end_date = datetime.strptime(project_end_date, "%Y-%m-%d").date()
+                        end_date = _parse_iso_date(project_end_date)
                         project_remaining_days = (end_date - today).days
                     except:
                         pass
@@ -1453,7 +1671,7 @@ class Database:
             client_remaining_days = 0
             if client_end_date:
                 try:
-                    end_date = datetime.strptime(client_end_date, "%Y-%m-%d").date()
+                    end_date = _parse_iso_date(client_end_date)
                     client_remaining_days = (end_date - today).days
                 except:
                     pass
@@ -1591,7 +1809,6 @@ class Database:
         remaining_budget = budget - actual_cost
         
         # Calcola giorni mancanti e trascorsi
-        from datetime import datetime, date
         try:
             start_date = datetime.strptime(schedule["start_date"], "%Y-%m-%d").date()
             end_date = datetime.strptime(schedule["end_date"], "%Y-%m-%d").date()
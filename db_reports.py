@@ -3,6 +3,21 @@ from __future__ import annotations
 from typing import Any
 
 
+def _sort_by_total(rows: list[dict[str, Any]], key: str = "total_hours") -> list[dict[str, Any]]:
+    """Ordina i riepiloghi aggregati per totale decrescente (in Python, senza ORDER BY su SQLite)."""
+    rows.sort(key=lambda row: row[key] or 0, reverse=True)
+    return rows
+
+
+# Campi di raggruppamento restituiti per ciascun riepilogo del report filtrato.
+_FILTERED_SUMMARY_FIELDS: dict[str, tuple[str, ...]] = {
+    "client": ("client_name",),
+    "project": ("client_name", "project_name"),
+    "activity": ("activity_name",),
+    "user": ("full_name",),
+}
+
+
 def get_report_client_data_impl(
     db: Any,
     client_id: int,
@@ -122,10 +137,10 @@ def get_report_project_data_impl(db: Any, project_id: int) -> dict[str, Any]:
         JOIN activities a ON a.id = t.activity_id
         WHERE t.project_id = ?
         GROUP BY a.id
-        ORDER BY total_hours DESC
         """,
         (project_id,),
     )
+    _sort_by_total(activities_summary)
 
     users_summary = db._fetchall(
         """
@@ -136,10 +151,10 @@ def get_report_project_data_impl(db: Any, project_id: int) -> dict[str, Any]:
         JOIN users u ON u.id = t.user_id
         WHERE t.project_id = ?
         GROUP BY u.id
-        ORDER BY total_hours DESC
         """,
         (project_id,),
     )
+    _sort_by_total(users_summary)
 
     total_planned = sum(float(s["planned_hours"]) for s in schedules)
     total_budget = sum(float(s.get("budget", 0.0)) for s in schedules)
@@ -194,6 +209,18 @@ def get_report_period_data_impl(
         tuple(params),
     )
 
+    if not timesheets:
+        return {
+            "start_date": start_date,
+            "end_date": end_date,
+            "timesheets": [],
+            "clients_summary": [],
+            "projects_summary": [],
+            "users_summary": [],
+            "total_hours": 0.0,
+            "total_cost": 0.0,
+        }
+
     clients_summary = db._fetchall(
         f"""
         SELECT c.name AS client_name,
@@ -204,10 +231,10 @@ def get_report_period_data_impl(
         JOIN clients c ON c.id = p.client_id
         WHERE t.work_date >= ? AND t.work_date <= ? {where_clause}
         GROUP BY c.id
-        ORDER BY total_hours DESC
         """,
         tuple(params),
     )
+    _sort_by_total(clients_summary)
 
     projects_summary = db._fetchall(
         f"""
@@ -219,10 +246,10 @@ def get_report_period_data_impl(
         JOIN clients c ON c.id = p.client_id
         WHERE t.work_date >= ? AND t.work_date <= ? {where_clause}
         GROUP BY p.id
-        ORDER BY total_hours DESC
         """,
         tuple(params),
     )
+    _sort_by_total(projects_summary)
 
     users_summary = db._fetchall(
         f"""
@@ -234,10 +261,10 @@ def get_report_period_data_impl(
         JOIN users u ON u.id = t.user_id
         WHERE t.work_date >= ? AND t.work_date <= ? {where_clause}
         GROUP BY u.id
-        ORDER BY total_hours DESC
         """,
         tuple(params),
     )
+    _sort_by_total(users_summary)
 
     total_hours = sum(float(t["hours"]) for t in timesheets)
     total_cost = sum(float(t["cost"]) for t in timesheets)
@@ -278,6 +305,21 @@ def get_report_user_data_impl(
         (user_id, start_date, end_date),
     )
 
+    if not timesheets:
+        return {
+            "user": dict(user),
+            "start_date": start_date,
+            "end_date": end_date,
+            "timesheets": [],
+            "clients_summary": [],
+            "projects_summary": [],
+            "activities_summary": [],
+            "total_hours": 0.0,
+            "total_cost": 0.0,
+            "work_days": 0,
+            "avg_hours_per_day": 0,
+        }
+
     clients_summary = db._fetchall(
         """
         SELECT c.name AS client_name,
@@ -288,10 +330,10 @@ def get_report_user_data_impl(
         JOIN clients c ON c.id = p.client_id
         WHERE t.user_id = ? AND t.work_date >= ? AND t.work_date <= ?
         GROUP BY c.id
-        ORDER BY total_hours DESC
         """,
         (user_id, start_date, end_date),
     )
+    _sort_by_total(clients_summary)
 
     projects_summary = db._fetchall(
         """
@@ -303,10 +345,10 @@ def get_report_user_data_impl(
         JOIN clients c ON c.id = p.client_id
         WHERE t.user_id = ? AND t.work_date >= ? AND t.work_date <= ?
         GROUP BY p.id
-        ORDER BY total_hours DESC
         """,
         (user_id, start_date, end_date),
     )
+    _sort_by_total(projects_summary)
 
     activities_summary = db._fetchall(
         """
@@ -317,16 +359,23 @@ def get_report_user_data_impl(
         JOIN activities a ON a.id = t.activity_id
         WHERE t.user_id = ? AND t.work_date >= ? AND t.work_date <= ?
         GROUP BY a.id
-        ORDER BY total_hours DESC
         """,
         (user_id, start_date, end_date),
     )
-
-    total_hours = sum(float(t["hours"]) for t in timesheets)
-    total_cost = sum(float(t["cost"]) for t in timesheets)
-
-    work_dates = set(t["work_date"] for t in timesheets)
-    work_days = len(work_dates)
+    _sort_by_total(activities_summary)
+
+    # Totali dalle righe già lette (servono comunque al report): nessuna seconda query.
+    # Righe ordinate per work_date, quindi i giorni lavorati si contano ai cambi di data.
+    total_hours = 0.0
+    total_cost = 0.0
+    work_days = 0
+    last_date = None
+    for t in timesheets:
+        total_hours += float(t["hours"])
+        total_cost += float(t["cost"])
+        if t["work_date"] != last_date:
+            work_days += 1
+            last_date = t["work_date"]
     avg_hours_per_day = total_hours / work_days if work_days > 0 else 0
 
     return {
@@ -358,6 +407,23 @@ def get_report_general_data_impl(
         params = [start_date, end_date]
 
     schedules = db.get_schedule_control_data()
+    at_risk = [s for s in schedules if s["remaining_hours"] < 0 or (s["remaining_days"] < 7 and s["remaining_hours"] > 0)]
+
+    has_timesheets = db._fetchone(f"SELECT 1 AS found FROM timesheets t {date_filter} LIMIT 1", tuple(params))
+    if not has_timesheets:
+        return {
+            "start_date": start_date,
+            "end_date": end_date,
+            "schedules": schedules,
+            "schedules_at_risk": at_risk,
+            "clients_summary": [],
+            "projects_summary": [],
+            "users_summary": [],
+            "total_hours": 0.0,
+            "total_cost": 0.0,
+            "num_active_schedules": len(schedules),
+            "num_at_risk": len(at_risk),
+        }
 
     clients_summary = db._fetchall(
         f"""
@@ -369,10 +435,10 @@ def get_report_general_data_impl(
         JOIN clients c ON c.id = p.client_id
         {date_filter}
         GROUP BY c.id
-        ORDER BY total_cost DESC
         """,
         tuple(params),
     )
+    _sort_by_total(clients_summary, "total_cost")
 
     projects_summary = db._fetchall(
         f"""
@@ -384,11 +450,10 @@ def get_report_general_data_impl(
         JOIN clients c ON c.id = p.client_id
         {date_filter}
         GROUP BY p.id
-        ORDER BY total_cost DESC
-        LIMIT 10
         """,
         tuple(params),
     )
+    projects_summary = _sort_by_total(projects_summary, "total_cost")[:10]
 
     users_summary = db._fetchall(
         f"""
@@ -399,10 +464,10 @@ def get_report_general_data_impl(
         JOIN users u ON u.id = t.user_id
         {date_filter}
         GROUP BY u.id
-        ORDER BY total_hours DESC
         """,
         tuple(params),
     )
+    _sort_by_total(users_summary)
 
     if params:
         total_hours = db._fetchone(
@@ -414,8 +479,6 @@ def get_report_general_data_impl(
             "SELECT COALESCE(SUM(hours), 0) AS hours, COALESCE(SUM(cost), 0) AS cost FROM timesheets"
         )
 
-    at_risk = [s for s in schedules if s["remaining_hours"] < 0 or (s["remaining_days"] < 7 and s["remaining_hours"] > 0)]
-
     return {
         "start_date": start_date,
         "end_date": end_date,
@@ -482,65 +545,63 @@ def get_report_filtered_data_impl(
         p,
     )
 
-    clients_summary = db._fetchall(
-        f"""
-        SELECT c.name AS client_name,
-               SUM(t.hours) AS total_hours, SUM(t.cost) AS total_cost
-        FROM timesheets t
-        JOIN projects p  ON p.id = t.project_id
-        JOIN clients c   ON c.id = p.client_id
-        JOIN activities a ON a.id = t.activity_id
-        JOIN users u ON u.id = t.user_id
-        {where}
-        GROUP BY c.id ORDER BY total_hours DESC
-        """,
-        p,
-    )
-
-    projects_summary = db._fetchall(
-        f"""
-        SELECT c.name AS client_name, p.name AS project_name,
-               SUM(t.hours) AS total_hours, SUM(t.cost) AS total_cost
-        FROM timesheets t
-        JOIN projects p  ON p.id = t.project_id
-        JOIN clients c   ON c.id = p.client_id
-        JOIN activities a ON a.id = t.activity_id
-        JOIN users u ON u.id = t.user_id
-        {where}
-        GROUP BY p.id ORDER BY total_hours DESC
-        """,
-        p,
-    )
-
-    activities_summary = db._fetchall(
+    if not timesheets:
+        return {
+            "timesheets": [],
+            "clients_summary": [],
+            "projects_summary": [],
+            "activities_summary": [],
+            "users_summary": [],
+            "total_hours": 0.0,
+            "total_cost": 0.0,
+            "start_date": start_date,
+            "end_date": end_date,
+        }
+
+    # Un'unica query: il set filtrato viene calcolato una volta nella CTE e aggregato per ogni livello.
+    summary_rows = db._fetchall(
         f"""
-        SELECT a.name AS activity_name,
-               SUM(t.hours) AS total_hours, SUM(t.cost) AS total_cost
-        FROM timesheets t
-        JOIN projects p  ON p.id = t.project_id
-        JOIN clients c   ON c.id = p.client_id
-        JOIN activities a ON a.id = t.activity_id
-        JOIN users u ON u.id = t.user_id
-        {where}
-        GROUP BY a.id ORDER BY total_hours DESC
+        WITH f AS (
+            SELECT t.hours, t.cost,
+                   c.id AS client_id, c.name AS client_name,
+                   p.id AS project_id, p.name AS project_name,
+                   a.id AS activity_id, a.name AS activity_name,
+                   u.id AS user_id, u.full_name
+            FROM timesheets t
+            JOIN projects p  ON p.id = t.project_id
+            JOIN clients c   ON c.id = p.client_id
+            JOIN activities a ON a.id = t.activity_id
+            JOIN users u ON u.id = t.user_id
+            {where}
+        )
+        SELECT 'client' AS kind, client_name, NULL AS project_name, NULL AS activity_name, NULL AS full_name,
+               SUM(hours) AS total_hours, SUM(cost) AS total_cost
+        FROM f GROUP BY client_id
+        UNION ALL
+        SELECT 'project', client_name, project_name, NULL, NULL, SUM(hours), SUM(cost)
+        FROM f GROUP BY project_id
+        UNION ALL
+        SELECT 'activity', NULL, NULL, activity_name, NULL, SUM(hours), SUM(cost)
+        FROM f GROUP BY activity_id
+        UNION ALL
+        SELECT 'user', NULL, NULL, NULL, full_name, SUM(hours), SUM(cost)
+        FROM f GROUP BY user_id
         """,
         p,
     )
 
-    users_summary = db._fetchall(
-        f"""
-        SELECT u.full_name,
-               SUM(t.hours) AS total_hours, SUM(t.cost) AS total_cost
-        FROM timesheets t
-        JOIN projects p  ON p.id = t.project_id
-        JOIN clients c   ON c.id = p.client_id
-        JOIN activities a ON a.id = t.activity_id
-        JOIN users u ON u.id = t.user_id
-        {where}
-        GROUP BY u.id ORDER BY total_hours DESC
-        """,
-        p,
-    )
+    summaries: dict[str, list[dict[str, Any]]] = {kind: [] for kind in _FILTERED_SUMMARY_FIELDS}
+    for row in summary_rows:
+        kind = row["kind"]
+        entry = {field: row[field] for field in _FILTERED_SUMMARY_FIELDS[kind]}
+        entry["total_hours"] = row["total_hours"]
+        entry["total_cost"] = row["total_cost"]
+        summaries[kind].append(entry)
+
+    clients_summary = _sort_by_total(summaries["client"])
+    projects_summary = _sort_by_total(summaries["project"])
+    activities_summary = _sort_by_total(summaries["activity"])
+    users_summary = _sort_by_total(summaries["user"])
 
     total_hours = sum(float(t["hours"]) for t in timesheets)
     total_cost = sum(float(t["cost"]) for t in timesheets)
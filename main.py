@@ -3,12 +3,17 @@
 import calendar
 import sqlite3
 import sys
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import date, datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterator, TypeVar
 
 from PyQt6.QtCore import QDate, QTimer, Qt
-from PyQt6.QtGui import QColor
+from PyQt6.QtGui import QColor, QFont
 from PyQt6.QtWidgets import (
     QApplication,
     QCalendarWidget,
@@ -44,11 +49,13 @@ from PyQt6.QtWidgets import (
 )
 
 from db import AUTO_BACKUP_INTERVAL_MINUTES, CFG_DIR, Database
-from pdf_reports import PDFReportGenerator
 
 BASE_DIR = Path(__file__).resolve().parent
 APP_VERSION = (BASE_DIR / "VERSION").read_text(encoding="utf-8").strip()
 
+# Valori memoizzati da TimesheetWindow._cached_options: lista di opzioni o opzioni raggruppate per id.
+_OptionsT = TypeVar("_OptionsT", list[str], dict[int, list[str]])
+
 DARK_THEME = """
 QWidget {
     background-color: #1e1e2e;
@@ -190,39 +197,197 @@ QGroupBox::title { left: 10px; padding: 0 4px; }
 """
 
 
+MONTH_NAMES = tuple(calendar.month_name[i].title() for i in range(1, 13))
+
+
 def _readonly_item(text: Any) -> QTableWidgetItem:
     item = QTableWidgetItem(str(text))
     item.setFlags(item.flags() & ~Qt.ItemFlag.ItemIsEditable)
     return item
 
 
+@contextmanager
+def _bulk_update(widget: QWidget) -> Iterator[None]:
+    """Segnali e ridisegno sospesi durante un aggiornamento massivo: un solo repaint alla fine."""
+    widget.blockSignals(True)
+    widget.setUpdatesEnabled(False)
+    try:
+        yield
+    finally:
+        widget.setUpdatesEnabled(True)
+        widget.blockSignals(False)
+
+
 def _to_qdate(dt: date) -> QDate:
     return QDate(dt.year, dt.month, dt.day)
 
 
+@lru_cache(maxsize=4096)
+def _iso_to_ui_date(value: str) -> str:
+    """Converte 'YYYY-MM-DD' in 'DD/MM/YYYY'; i valori non validi sono restituiti invariati.
+
+    Memoizzata: le stesse date di programmazione ricorrono a ogni ridisegno di tabelle e alberi.
+    """
+    if not value:
+        return ""
+    # Percorso rapido per le date ISO complete salvate nel DB: solo slicing, niente strptime.
+    # Solo cifre ASCII, anni 1000-9999, mesi 01-12 e giorni 01-28 (validi in ogni mese): il resto
+    # passa da strptime, così i valori non validi restano invariati.
+    if len(value) == 10 and value[4] == "-" and value[7] == "-" and value.isascii():
+        year, month, day = value[:4], value[5:7], value[8:]
+        if (
+            year.isdigit()
+            and month.isdigit()
+            and day.isdigit()
+            and year >= "1000"
+            and "01" <= month <= "12"
+            and "01" <= day <= "28"
+        ):
+            return f"{day}/{month}/{year}"
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%d/%m/%Y")
+    except (TypeError, ValueError):
+        return value
+
+
+@lru_cache(maxsize=4096)
+def _iso_span_days(start_date: str, end_date: str) -> int:
+    """Giorni tra due date 'YYYY-MM-DD' (0 se non valide); memoizzata come _iso_to_ui_date."""
+    try:
+        return (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")).days
+    except (TypeError, ValueError):
+        return 0
+
+
+@dataclass(frozen=True, slots=True)
+class TimesheetRow:
+    """Dati di una riga ore del giorno necessari a ricaricarla nel form."""
+
+    id: int
+    client_display: str
+    project_display: str
+    activity_display: str
+    hours: float
+    note: str
+
+    @classmethod
+    def from_db(cls, row: dict[str, Any]) -> TimesheetRow:
+        return cls(
+            id=int(row["id"]),
+            client_display=row["client_display"],
+            project_display=row["project_display"],
+            activity_display=row["activity_display"],
+            hours=float(row["hours"]),
+            note=row["note"] or "",
+        )
+
+
+LAST_USER_FILE = CFG_DIR / "last_user.txt"
+_last_user_cache: str | None = None
+
+
+def _load_last_user() -> str:
+    """Ultimo username usato: letto da file una sola volta per processo."""
+    global _last_user_cache
+    if _last_user_cache is None:
+        _last_user_cache = "admin"
+        if LAST_USER_FILE.exists():
+            try:
+                _last_user_cache = LAST_USER_FILE.read_text(encoding="utf-8").strip() or "admin"
+            except Exception:
+                pass
+    return _last_user_cache
+
+
+def _save_last_user(username: str) -> None:
+    """Salva l'ultimo username solo se cambia; file temporaneo + replace per non lasciarlo troncato."""
+    global _last_user_cache
+    if username == _load_last_user():
+        return
+    try:
+        CFG_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_file = LAST_USER_FILE.with_suffix(".tmp")
+        tmp_file.write_text(username, encoding="utf-8")
+        tmp_file.replace(LAST_USER_FILE)
+    except Exception:
+        # Scrittura fallita: la cache resta com'era, così il prossimo accesso riprova a salvare.
+        return
+    _last_user_cache = username
+
+
 class HoursCalendarWidget(QCalendarWidget):
+    # Colori delle celle creati una sola volta: paintCell viene chiamato per ogni cella a ogni ridisegno.
+    _CELL_PALETTES: dict[bool, dict[str, QColor]] = {
+        True: {
+            "base_bg": QColor("#181825"),
+            "base_bg_other": QColor("#121221"),
+            "base_fg": QColor("#cdd6f4"),
+            "base_fg_other": QColor("#6b7280"),
+            "border": QColor("#313244"),
+            "weekend_bg": QColor("#8b1d1d"),
+            "weekend_fg": QColor("#fee2e2"),
+            "badge_bg": QColor("#1d4ed8"),
+            "badge_fg": QColor("#dbeafe"),
+            "badge_border": QColor("#60a5fa"),
+        },
+        False: {
+            "base_bg": QColor("#ffffff"),
+            "base_bg_other": QColor("#f3f4f6"),
+            "base_fg": QColor("#1f2937"),
+            "base_fg_other": QColor("#9ca3af"),
+            "border": QColor("#d1d5db"),
+            "weekend_bg": QColor("#ef4444"),
+            "weekend_fg": QColor("#ffffff"),
+            "badge_bg": QColor("#1d4ed8"),
+            "badge_fg": QColor("#ffffff"),
+            "badge_border": QColor("#1e40af"),
+        },
+    }
+    _SELECTED_COLORS = (QColor("#facc15"), QColor("#111827"), QColor("#92400e"), QColor("#fef3c7"), QColor("#78350f"))
+    _TODAY_COLORS = (QColor("#2563eb"), QColor("#ffffff"), QColor("#dbeafe"), QColor("#1e3a8a"), QColor("#93c5fd"))
+    _WEEKEND_BADGE_COLORS = (QColor("#7f1d1d"), QColor("#fee2e2"), QColor("#991b1b"))
+
     def __init__(self, dark_mode: bool = True, parent: QWidget | None = None) -> None:
         super().__init__(parent)
         self._is_dark_mode = dark_mode
-        self._hours_by_day: dict[int, float] = {}
+        # Ore per giorno del mese indicizzate direttamente dal numero del giorno (indice 0 inutilizzato).
+        self._hours_by_day: list[float] = [0.0] * 32
+        self._font_cache: dict[str, tuple[QFont, QFont, QFont]] = {}
         self.setGridVisible(True)
         self.setVerticalHeaderFormat(QCalendarWidget.VerticalHeaderFormat.ISOWeekNumbers)
         self._apply_calendar_style()
-        self.currentPageChanged.connect(lambda _y, _m: QTimer.singleShot(0, self._tune_headers))
-        QTimer.singleShot(0, self._tune_headers)
+        # Un solo timer condiviso: più richieste (resize, cambio pagina, tema) nello stesso
+        # giro di event loop producono un unico ricalcolo delle intestazioni.
+        self._tune_timer = QTimer(self)
+        self._tune_timer.setSingleShot(True)
+        self._tune_timer.setInterval(0)
+        self._tune_timer.timeout.connect(self._tune_headers)
+        self.currentPageChanged.connect(self._schedule_tune_headers)
+        self._schedule_tune_headers()
+
+    def _schedule_tune_headers(self, *_args: Any) -> None:
+        self._tune_timer.start()
 
     def set_theme_mode(self, dark_mode: bool) -> None:
+        if dark_mode == self._is_dark_mode:
+            return
         self._is_dark_mode = dark_mode
         self._apply_calendar_style()
         self.updateCells()
-        QTimer.singleShot(0, self._tune_headers)
+        self._schedule_tune_headers()
 
     def resizeEvent(self, event) -> None:  # type: ignore[override]
         super().resizeEvent(event)
-        QTimer.singleShot(0, self._tune_headers)
+        self._schedule_tune_headers()
 
     def set_hours_map(self, hours_by_day: dict[int, float]) -> None:
-        self._hours_by_day = {int(k): float(v) for k, v in hours_by_day.items()}
+        new_hours = [0.0] * 32
+        for day, hours in hours_by_day.items():
+            new_hours[int(day)] = float(hours or 0.0)
+        # Le celle sono già riusate da QCalendarWidget: ridisegniamo solo se i totali cambiano.
+        if new_hours == self._hours_by_day:
+            return
+        self._hours_by_day = new_hours
         self.updateCells()
 
     def _tune_headers(self) -> None:
@@ -270,7 +435,14 @@ class HoursCalendarWidget(QCalendarWidget):
         table.setRowHeight(rows - 1, last_day_row_h)
 
     def _apply_calendar_style(self) -> None:
-        if self._is_dark_mode:
+        stylesheet = self._calendar_stylesheet(self._is_dark_mode)
+        if self.styleSheet() != stylesheet:
+            self.setStyleSheet(stylesheet)
+
+    @staticmethod
+    @lru_cache(maxsize=2)
+    def _calendar_stylesheet(dark_mode: bool) -> str:
+        if dark_mode:
             calendar_bg = "#181825"
             weekday_bg = "#4b5563"
             weeknum_bg = "#4b5563"
@@ -283,8 +455,7 @@ class HoursCalendarWidget(QCalendarWidget):
             header_fg = "#ffffff"
             border = "#6b7280"
 
-        self.setStyleSheet(
-            f"""
+        return f"""
 QCalendarWidget QTableView {{
     background-color: {calendar_bg};
     selection-background-color: transparent;
@@ -321,7 +492,20 @@ QCalendarWidget QTableView QHeaderView::section:vertical {{
     font-weight: 800;
 }}
 """
-        )
+
+    def _cell_fonts(self, base: QFont) -> tuple[QFont, QFont, QFont]:
+        """Font normale, grassetto e badge ore derivati dal font base, creati una volta per font."""
+        key = base.key()
+        fonts = self._font_cache.get(key)
+        if fonts is None:
+            normal = QFont(base)
+            normal.setBold(False)
+            bold = QFont(base)
+            bold.setBold(True)
+            hours = QFont(bold)
+            hours.setPointSize(max(8, base.pointSize() - 1))
+            fonts = self._font_cache[key] = (normal, bold, hours)
+        return fonts
 
     def paintCell(self, painter, rect, qdate) -> None:  # type: ignore[override]
         in_current_month = qdate.year() == self.yearShown() and qdate.month() == self.monthShown()
@@ -329,74 +513,41 @@ QCalendarWidget QTableView QHeaderView::section:vertical {{
         is_selected = qdate == self.selectedDate()
         is_weekend = qdate.dayOfWeek() in (6, 7)
 
-        if self._is_dark_mode:
-            base_bg = QColor("#181825" if in_current_month else "#121221")
-            base_fg = QColor("#cdd6f4" if in_current_month else "#6b7280")
-            border = QColor("#313244")
-            weekend_bg = QColor("#8b1d1d")
-            weekend_fg = QColor("#fee2e2")
-            default_badge_bg = QColor("#1d4ed8")
-            default_badge_fg = QColor("#dbeafe")
-            default_badge_border = QColor("#60a5fa")
-        else:
-            base_bg = QColor("#ffffff" if in_current_month else "#f3f4f6")
-            base_fg = QColor("#1f2937" if in_current_month else "#9ca3af")
-            border = QColor("#d1d5db")
-            weekend_bg = QColor("#ef4444")
-            weekend_fg = QColor("#ffffff")
-            default_badge_bg = QColor("#1d4ed8")
-            default_badge_fg = QColor("#ffffff")
-            default_badge_border = QColor("#1e40af")
+        palette = self._CELL_PALETTES[self._is_dark_mode]
 
         # Priorita colori: selezione (giallo) > oggi (blu) > weekend (rosso).
         if is_selected:
-            bg = QColor("#facc15")
-            fg = QColor("#111827")
-            badge_bg = QColor("#92400e")
-            badge_fg = QColor("#fef3c7")
-            badge_border = QColor("#78350f")
+            bg, fg, badge_bg, badge_fg, badge_border = self._SELECTED_COLORS
         elif is_today:
-            bg = QColor("#2563eb")
-            fg = QColor("#ffffff")
-            badge_bg = QColor("#dbeafe")
-            badge_fg = QColor("#1e3a8a")
-            badge_border = QColor("#93c5fd")
+            bg, fg, badge_bg, badge_fg, badge_border = self._TODAY_COLORS
         elif is_weekend and in_current_month:
-            bg = weekend_bg
-            fg = weekend_fg
-            badge_bg = QColor("#7f1d1d")
-            badge_fg = QColor("#fee2e2")
-            badge_border = QColor("#991b1b")
+            bg, fg = palette["weekend_bg"], palette["weekend_fg"]
+            badge_bg, badge_fg, badge_border = self._WEEKEND_BADGE_COLORS
         else:
-            bg = base_bg
-            fg = base_fg
-            badge_bg = default_badge_bg
-            badge_fg = default_badge_fg
-            badge_border = default_badge_border
+            bg = palette["base_bg"] if in_current_month else palette["base_bg_other"]
+            fg = palette["base_fg"] if in_current_month else palette["base_fg_other"]
+            badge_bg, badge_fg, badge_border = palette["badge_bg"], palette["badge_fg"], palette["badge_border"]
+        border = palette["border"]
 
         painter.save()
         painter.fillRect(rect.adjusted(1, 1, -1, -1), bg)
         painter.setPen(border)
         painter.drawRect(rect.adjusted(0, 0, -1, -1))
 
-        num_font = painter.font()
-        num_font.setBold(is_today or is_selected or (is_weekend and in_current_month))
-        painter.setFont(num_font)
+        normal_font, bold_font, hours_font = self._cell_fonts(painter.font())
+        painter.setFont(bold_font if is_today or is_selected or (is_weekend and in_current_month) else normal_font)
         painter.setPen(fg)
         top_rect = rect.adjusted(4, 2, -4, -rect.height() // 2)
         painter.drawText(top_rect, int(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop), str(qdate.day()))
 
         if in_current_month:
-            hours = float(self._hours_by_day.get(qdate.day(), 0.0) or 0.0)
+            hours = self._hours_by_day[qdate.day()]
             if hours > 0:
                 bottom_rect = rect.adjusted(4, rect.height() - 15, -4, -3)
                 painter.fillRect(bottom_rect, badge_bg)
                 painter.setPen(badge_border)
                 painter.drawRect(bottom_rect.adjusted(0, 0, -1, -1))
 
-                hours_font = painter.font()
-                hours_font.setBold(True)
-                hours_font.setPointSize(max(8, hours_font.pointSize() - 1))
                 painter.setFont(hours_font)
                 painter.setPen(badge_fg)
                 painter.drawText(
@@ -432,14 +583,7 @@ class LoginDialog(QDialog):
         form.addRow("Password", self.password_edit)
         layout.addLayout(form)
 
-        last_user_file = CFG_DIR / "last_user.txt"
-        last_user = "admin"
-        if last_user_file.exists():
-            try:
-                last_user = last_user_file.read_text(encoding="utf-8").strip() or "admin"
-            except Exception:
-                last_user = "admin"
-        self.username_edit.setText(last_user)
+        self.username_edit.setText(_load_last_user())
         self.password_edit.setFocus()
 
         buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
@@ -456,11 +600,7 @@ class LoginDialog(QDialog):
             QMessageBox.critical(self, "Accesso", "Credenziali non valide o utente disattivato.")
             return
 
-        try:
-            CFG_DIR.mkdir(parents=True, exist_ok=True)
-            (CFG_DIR / "last_user.txt").write_text(username, encoding="utf-8")
-        except Exception:
-            pass
+        _save_last_user(username)
 
         self.user = user
         self.accept()
@@ -529,12 +669,7 @@ class ProjectDialog(QDialog):
 
     @staticmethod
     def _iso_to_ui(value: str) -> str:
-        if not value:
-            return ""
-        try:
-            return datetime.strptime(value, "%Y-%m-%d").strftime("%d/%m/%Y")
-        except ValueError:
-            return value
+        return _iso_to_ui_date(value)
 
     def _build_ui(self, initial: dict[str, Any], schedule: dict[str, Any] | None, client_name: str) -> None:
         layout = QVBoxLayout(self)
@@ -647,12 +782,7 @@ class ActivityDialog(QDialog):
 
     @staticmethod
     def _iso_to_ui(value: str) -> str:
-        if not value:
-            return ""
-        try:
-            return datetime.strptime(value, "%Y-%m-%d").strftime("%d/%m/%Y")
-        except ValueError:
-            return value
+        return _iso_to_ui_date(value)
 
     def _build_ui(
         self,
@@ -937,6 +1067,13 @@ class PDFReportDialog(QDialog):
         self.all_projects = self.app.db.list_projects()
         self.all_activities = self.app.db.list_activities()
         self.all_users = self.app.db.list_users(include_inactive=False)
+        # Commesse per cliente e attività per commessa raggruppate una volta: i cambi di combo non interrogano il DB.
+        self.projects_by_client: dict[int, list[dict[str, Any]]] = defaultdict(list)
+        for p in self.all_projects:
+            self.projects_by_client[p["client_id"]].append(p)
+        self.activities_by_project: dict[int, list[dict[str, Any]]] = defaultdict(list)
+        for a in self.all_activities:
+            self.activities_by_project[a["project_id"]].append(a)
 
         self.client_combo.addItems(["Tutti i clienti"] + [f"{c['id']} - {c['name']}" for c in self.all_clients])
         self.project_combo.addItems(
@@ -948,7 +1085,7 @@ class PDFReportDialog(QDialog):
     def _on_client_change(self) -> None:
         cid = self.app._id_from_option(self.client_combo.currentText())
         if cid:
-            projects = self.app.db.list_projects(client_id=cid)
+            projects = self.projects_by_client.get(cid, ())
             options = ["Tutte le commesse"] + [f"{p['id']} - {p['client_name']} / {p['name']}" for p in projects]
         else:
             options = ["Tutte le commesse"] + [f"{p['id']} - {p['client_name']} / {p['name']}" for p in self.all_projects]
@@ -962,7 +1099,7 @@ class PDFReportDialog(QDialog):
     def _on_project_change(self) -> None:
         pid = self.app._id_from_option(self.project_combo.currentText())
         if pid:
-            activities = self.app.db.list_activities(project_id=pid)
+            activities = self.activities_by_project.get(pid, ())
             options = ["Tutte le attivita"] + [f"{a['id']} - {a['name']}" for a in activities]
         else:
             options = ["Tutte le attivita"] + [f"{a['id']} - {a['name']}" for a in self.all_activities]
@@ -1009,6 +1146,9 @@ class PDFReportDialog(QDialog):
             title_mode = "Dettagliato" if mode == "dettagliata" else ("Gerarchico" if mode == "gerarchica" else "Sintetico")
             title = f"Report {title_mode}"
 
+            # Import differito: reportlab serve solo quando si genera un PDF, non all'avvio.
+            from pdf_reports import PDFReportGenerator
+
             generator = PDFReportGenerator()
             if mode == "gerarchica":
                 output = generator.generate_hierarchical_report(data=data, title=title, subtitle=subtitle)
@@ -1021,26 +1161,88 @@ class PDFReportDialog(QDialog):
             QMessageBox.critical(self, "Errore", f"Errore durante la generazione del report:\n{exc}")
 
 class TimesheetWindow(QMainWindow):
+    # Widget delle schede referenziati dai refresh: None finché la scheda non è costruita
+    # (o dopo il logout), così le guardie sono semplici confronti e non hasattr.
+    _TAB_WIDGET_ATTRS = (
+        "qt_calendar",
+        "ts_client_combo",
+        "ts_project_combo",
+        "ts_activity_combo",
+        "ts_hours_entry",
+        "ts_note_text",
+        "ts_table",
+        "pm_client_combo",
+        "project_search_entry",
+        "projects_table",
+        "project_info_text",
+        "activity_search_entry",
+        "activities_table",
+        "activity_info_text",
+        "activity_users_list",
+        "plan_project_combo",
+        "plan_activity_combo",
+        "plan_table",
+        "ctrl_tree",
+        "diary_client_combo",
+        "diary_table",
+        "users_table",
+    )
+    # Colori del pannello controllo creati una volta sola, non per ogni riga dell'albero.
+    _CTRL_CLIENT_COLOR = QColor("#4ea1ff")
+    _CTRL_PROJECT_COLOR = QColor("#70b8ff")
+    _CTRL_ACTIVITY_COLOR = QColor("#7ed6a8")
+    _CTRL_CLOSED_COLOR = QColor("#8f8f8f")
+    _CTRL_TIMESHEET_COLOR = QColor("#9aa1af")
+
     def __init__(self, db: Database, user: dict[str, Any]) -> None:
         super().__init__()
         self.db = db
         self.current_user = user
         self.selected_date = date.today()
         self.is_dark_mode = True
-        self._timesheet_rows_by_id: dict[int, dict[str, Any]] = {}
+        self._timesheet_rows_by_id: dict[int, TimesheetRow] = {}
+        self._schedule_rows_by_id: dict[int, dict[str, Any]] = {}
         self._projects_data: list[dict[str, Any]] = []
         self._activities_data: list[dict[str, Any]] = []
+        # Testo di ricerca già applicato alle tabelle (per restringere il filtro in modo incrementale).
+        self._project_filter_applied = ""
+        self._activity_filter_applied = ""
         self.selected_project_id: int | None = None
         self.selected_activity_id: int | None = None
         self.editing_user_id: int | None = None
         self._diary_tab_index: int | None = None
+        self._lazy_tabs: dict[QWidget, tuple[Callable[[], None], Callable[[], None]]] = {}
+        # Valori presenti in ciascuna combo popolata via _set_combo_values: elenco ordinato
+        # (per saltare le ricostruzioni identiche) e insieme (membership O(1)).
+        self._combo_values: dict[QComboBox, list[str]] = {}
+        self._combo_value_sets: dict[QComboBox, set[str]] = {}
+        self._option_cache: dict[tuple[Any, ...], list[str] | dict[int, list[str]]] = {}
+        self._month_hours_cache: dict[tuple[int, int, int], dict[int, float]] = {}
+        self._month_hours_cache_token: tuple[int, int] | None = None
+        self._month_hours_page: tuple[int, int] | None = None
+        self._day_entries_sig: tuple[Any, ...] | None = None
+        self._option_cache_token: tuple[int, int] | None = None
 
         self.setWindowTitle(f"APP Timesheet v{APP_VERSION}")
         self.setMinimumSize(1280, 820)
 
+        self._reset_tab_widgets()
+        self._backup_lock = threading.Lock()
         self.backup_timer = QTimer(self)
         self.backup_timer.timeout.connect(self._run_periodic_backup)
 
+        self.month_hours_timer = QTimer(self)
+        self.month_hours_timer.setSingleShot(True)
+        self.month_hours_timer.setInterval(50)
+        self.month_hours_timer.timeout.connect(self._refresh_month_hours)
+
+        # Refresh richiesti nello stesso ciclo di eventi (salva/modifica/elimina) eseguiti una volta sola.
+        self._pending_refreshes: set[str] = set()
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(0)
+        self.refresh_timer.timeout.connect(self._run_pending_refreshes)
+
         self._apply_theme()
         self._build_ui()
         self._backup_now_and_schedule()
@@ -1053,20 +1255,90 @@ class TimesheetWindow(QMainWindow):
         app = QApplication.instance()
         if app is None:
             return
-        app.setStyleSheet(DARK_THEME if self.is_dark_mode else LIGHT_THEME)
-        if hasattr(self, "qt_calendar") and isinstance(self.qt_calendar, HoursCalendarWidget):
-            self.qt_calendar.set_theme_mode(self.is_dark_mode)
+        stylesheet = DARK_THEME if self.is_dark_mode else LIGHT_THEME
+        # Un solo ridisegno per foglio globale + calendario, e nessun re-polish se il tema non cambia.
+        self.setUpdatesEnabled(False)
+        try:
+            if app.styleSheet() != stylesheet:
+                app.setStyleSheet(stylesheet)
+            if isinstance(self.qt_calendar, HoursCalendarWidget):
+                self.qt_calendar.set_theme_mode(self.is_dark_mode)
+        finally:
+            self.setUpdatesEnabled(True)
+
+    def _reset_tab_widgets(self) -> None:
+        for attr in self._TAB_WIDGET_ATTRS:
+            setattr(self, attr, None)
 
     def _build_ui(self) -> None:
-        existing = self.centralWidget()
-        if existing is not None:
-            existing.deleteLater()
+        if self.centralWidget() is None:
+            self._build_shell()
+        else:
+            # Dopo il logout si ricostruiscono solo le schede: barra superiore e layout restano.
+            self._update_user_label()
+            self._reset_tab_widgets()
+            old_tabview = self.tabview
+            old_tabview.blockSignals(True)
+            self._root_layout.removeWidget(old_tabview)
+            old_tabview.hide()
+            old_tabview.deleteLater()
+
+        self.tabview = QTabWidget()
+        self.tabview.setTabPosition(QTabWidget.TabPosition.West)
+        self._root_layout.addWidget(self.tabview, 1)
+
+        if self._tab_enabled("tab_calendar"):
+            self.tab_calendar = QWidget()
+            self.tabview.addTab(self.tab_calendar, "Calendario Ore")
+            self.build_calendar_tab()
+
+        if self._tab_enabled("tab_master"):
+            self.tab_master = QWidget()
+            self.tabview.addTab(self.tab_master, "Gestione Commesse")
+            self.build_project_management_tab()
+
+        # Controllo, Diario e Utenti vengono costruite (e caricate) solo alla prima apertura.
+        self._lazy_tabs = {}
+        self._combo_values.clear()
+        self._combo_value_sets.clear()
+
+        if self._tab_enabled("tab_control"):
+            self.tab_control = QWidget()
+            self.tabview.addTab(self.tab_control, "Controllo")
+            self._lazy_tabs[self.tab_control] = (self.build_control_tab, self.refresh_control_panel)
+
+        self.tab_diary = QWidget()
+        self._diary_tab_index = self.tabview.addTab(self.tab_diary, "Diario")
+        self._lazy_tabs[self.tab_diary] = (self.build_diary_tab, self.refresh_diary_data)
+
+        self.tab_users = QWidget()
+        self.tabview.addTab(self.tab_users, "Utenti")
+        self._lazy_tabs[self.tab_users] = (self.build_users_tab, self.refresh_users_data)
+
+        with self.db.read_batch():
+            self.refresh_master_data()
+            self.refresh_day_entries()
+            self.refresh_schedule_list()
+            self.update_diary_alert()
 
+            self.tabview.currentChanged.connect(self._on_tab_changed)
+            self._on_tab_changed(self.tabview.currentIndex())
+
+    def _on_tab_changed(self, index: int) -> None:
+        entry = self._lazy_tabs.pop(self.tabview.widget(index), None)
+        if entry is None:
+            return
+        build, refresh = entry
+        build()
+        refresh()
+
+    def _build_shell(self) -> None:
         central = QWidget()
         self.setCentralWidget(central)
         root = QVBoxLayout(central)
         root.setContentsMargins(10, 10, 10, 10)
         root.setSpacing(10)
+        self._root_layout = root
 
         topbar = QHBoxLayout()
         title = QLabel(f"APP Timesheet v{APP_VERSION}")
@@ -1087,41 +1359,6 @@ class TimesheetWindow(QMainWindow):
 
         root.addLayout(topbar)
 
-        self.tabview = QTabWidget()
-        self.tabview.setTabPosition(QTabWidget.TabPosition.West)
-        root.addWidget(self.tabview, 1)
-
-        if self._tab_enabled("tab_calendar"):
-            self.tab_calendar = QWidget()
-            self.tabview.addTab(self.tab_calendar, "Calendario Ore")
-            self.build_calendar_tab()
-
-        if self._tab_enabled("tab_master"):
-            self.tab_master = QWidget()
-            self.tabview.addTab(self.tab_master, "Gestione Commesse")
-            self.build_project_management_tab()
-
-        if self._tab_enabled("tab_control"):
-            self.tab_control = QWidget()
-            self.tabview.addTab(self.tab_control, "Controllo")
-            self.build_control_tab()
-
-        self.tab_diary = QWidget()
-        self._diary_tab_index = self.tabview.addTab(self.tab_diary, "Diario")
-        self.build_diary_tab()
-
-        self.tab_users = QWidget()
-        self.tabview.addTab(self.tab_users, "Utenti")
-        self.build_users_tab()
-
-        self.refresh_master_data()
-        self.refresh_day_entries()
-        self.refresh_schedule_list()
-        self.refresh_control_panel()
-        self.refresh_diary_data()
-        self.refresh_users_data()
-        self.update_diary_alert()
-
     def _tab_enabled(self, key: str) -> bool:
         if self.is_admin:
             return True
@@ -1134,8 +1371,10 @@ class TimesheetWindow(QMainWindow):
         )
 
     def _to_float(self, value: str, field_name: str) -> float:
+        # La copia con replace serve solo se c'è la virgola decimale.
+        text = value.replace(",", ".") if "," in value else value
         try:
-            parsed = float(value.replace(",", "."))
+            parsed = float(text)
         except ValueError as exc:
             raise ValueError(f"{field_name}: valore non valido.") from exc
         if parsed < 0:
@@ -1147,26 +1386,22 @@ class TimesheetWindow(QMainWindow):
         return f"{entity_id} - {name}"
 
     @staticmethod
-    def _project_option(row: dict[str, Any]) -> str:
-        return f"{row['id']} - {row['client_name']} / {row['name']}"
-
-    @staticmethod
-    def _activity_option(row: dict[str, Any]) -> str:
-        project_name = row.get("project_name", "")
-        prefix = f"{project_name} / " if project_name else ""
-        return f"{row['id']} - {prefix}{row['name']}"
-
-    @staticmethod
+    @lru_cache(maxsize=1024)
     def _id_from_option(value: str) -> int | None:
+        # Le stesse opzioni delle combo tornano a ogni cambio: dopo la prima volta è un accesso al dizionario.
         if not value or " - " not in value:
             return None
-        try:
-            return int(value.split("-", 1)[0].strip())
-        except Exception:
-            return None
+        # Niente eccezioni sul percorso comune: l'ID è la parte numerica prima del primo "-".
+        head = value.partition("-")[0].strip()
+        return int(head) if head.isdecimal() else None
 
     def _set_combo_values(self, combo: QComboBox, values: list[str]) -> None:
         safe_values = values or [""]
+        if self._combo_values.get(combo) == safe_values:
+            # Stessi valori nello stesso ordine: la selezione corrente resta valida, niente da ricostruire.
+            return
+        self._combo_values[combo] = list(safe_values)
+        self._combo_value_sets[combo] = set(safe_values)
         current = combo.currentText()
         combo.blockSignals(True)
         combo.clear()
@@ -1191,18 +1426,26 @@ class TimesheetWindow(QMainWindow):
             return None
 
     def _backup_now_and_schedule(self) -> None:
-        try:
-            self.db.create_backup()
-        except Exception as exc:
-            print(f"[backup] Errore creazione backup: {exc}")
+        self._start_backup("Errore creazione backup")
         interval_ms = AUTO_BACKUP_INTERVAL_MINUTES * 60 * 1000
         self.backup_timer.start(interval_ms)
 
     def _run_periodic_backup(self) -> None:
+        self._start_backup("Errore backup periodico")
+
+    def _start_backup(self, error_label: str) -> None:
+        # La copia del database gira fuori dal thread UI; non daemon per non troncare il file in chiusura.
+        threading.Thread(target=self._backup_worker, args=(error_label,), name="db-backup").start()
+
+    def _backup_worker(self, error_label: str) -> None:
+        if not self._backup_lock.acquire(blocking=False):
+            return
         try:
             self.db.create_backup()
         except Exception as exc:
-            print(f"[backup] Errore backup periodico: {exc}")
+            print(f"[backup] {error_label}: {exc}")
+        finally:
+            self._backup_lock.release()
 
     def _set_button_role(self, button: QPushButton, role: str) -> None:
         button.setObjectName(role)
@@ -1229,32 +1472,18 @@ class TimesheetWindow(QMainWindow):
         self._build_ui()
 
     def format_date_ui(self, value: str) -> str:
-        if not value:
-            return ""
-        try:
-            return datetime.strptime(value, "%Y-%m-%d").strftime("%d/%m/%Y")
-        except Exception:
-            return value
+        return _iso_to_ui_date(value)
 
     def _format_date_short(self, value: str) -> str:
-        if not value:
-            return ""
-        try:
-            return datetime.strptime(value, "%Y-%m-%d").strftime("%d/%m")
-        except Exception:
-            return value
+        formatted = _iso_to_ui_date(value)
+        return formatted[:5] if formatted != value else value
 
     def _format_remaining_days(self, days: int, start_date: str, end_date: str) -> str:
         if not start_date or not end_date:
             return ""
-        try:
-            start = datetime.strptime(start_date, "%Y-%m-%d")
-            end = datetime.strptime(end_date, "%Y-%m-%d")
-            total = (end - start).days
-            threshold = total * 0.1
-        except Exception:
-            total = 0
-            threshold = 0
+        # Stesse coppie di date per cliente/commessa/attività a ogni refresh del pannello: calcolo memoizzato.
+        total = _iso_span_days(start_date, end_date)
+        threshold = total * 0.1
         if days < 0:
             return f"X {days}"
         if total > 0 and days <= threshold:
@@ -1284,10 +1513,15 @@ class TimesheetWindow(QMainWindow):
     def _ensure_combo_option(self, combo: QComboBox, value: str) -> None:
         if not value:
             return
-        for i in range(combo.count()):
-            if combo.itemText(i) == value:
-                return
+        values = self._combo_value_sets.get(combo)
+        if values is None:
+            values = self._combo_value_sets[combo] = {combo.itemText(i) for i in range(combo.count())}
+        if value in values:
+            return
+        values.add(value)
         combo.addItem(value)
+        if combo in self._combo_values:
+            self._combo_values[combo].append(value)
 
     def _parse_ui_date(self, value: str, field_name: str) -> str:
         try:
@@ -1341,6 +1575,8 @@ class TimesheetWindow(QMainWindow):
 
     # Calendario Ore
     def build_calendar_tab(self) -> None:
+        self._month_hours_page = None
+        self._day_entries_sig = None
         layout = QVBoxLayout(self.tab_calendar)
         layout.setContentsMargins(6, 6, 6, 6)
         layout.setSpacing(8)
@@ -1348,7 +1584,7 @@ class TimesheetWindow(QMainWindow):
         header = QHBoxLayout()
         header.addWidget(QLabel("Mese"))
         self.cal_month_combo = QComboBox()
-        self.cal_month_combo.addItems([calendar.month_name[i].title() for i in range(1, 13)])
+        self.cal_month_combo.addItems(MONTH_NAMES)
         header.addWidget(self.cal_month_combo)
 
         header.addWidget(QLabel("Anno"))
@@ -1439,19 +1675,19 @@ class TimesheetWindow(QMainWindow):
         self.day_total_label = QLabel("Totale giornata: 0.00 h")
         right_layout.addWidget(self.day_total_label)
 
-        self.ts_table = QTableWidget(0, 9 if self.is_admin else 7)
-        headers = (
+        # Stesse colonne per tutti i ruoli: tariffa e costo sono solo nascoste ai non admin.
+        self.ts_table = QTableWidget(0, 9)
+        self.ts_table.setHorizontalHeaderLabels(
             ["ID", "Utente", "Cliente", "Commessa", "Attivita", "Ore", "Tariffa", "Costo", "Note"]
-            if self.is_admin
-            else ["ID", "Utente", "Cliente", "Commessa", "Attivita", "Ore", "Note"]
         )
-        self.ts_table.setHorizontalHeaderLabels(headers)
         self.ts_table.setAlternatingRowColors(True)
         self.ts_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
         self.ts_table.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
         self.ts_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
         self.ts_table.itemSelectionChanged.connect(self.on_timesheet_table_select)
         self.ts_table.setColumnHidden(0, True)
+        self.ts_table.setColumnHidden(6, not self.is_admin)
+        self.ts_table.setColumnHidden(7, not self.is_admin)
         right_layout.addWidget(self.ts_table, 1)
 
         splitter.addWidget(right_panel)
@@ -1462,12 +1698,16 @@ class TimesheetWindow(QMainWindow):
 
     def _on_calendar_selected(self) -> None:
         qd = self.qt_calendar.selectedDate()
-        self._set_calendar_date(date(qd.year(), qd.month(), qd.day()))
+        new_date = date(qd.year(), qd.month(), qd.day())
+        # setSelectedDate in _set_calendar_date riemette il segnale: la data è già applicata.
+        if new_date == self.selected_date:
+            return
+        self._set_calendar_date(new_date)
 
     def _on_calendar_page_changed(self, year: int, month: int) -> None:
         self.cal_year_combo.setCurrentText(str(year))
         self.cal_month_combo.setCurrentIndex(month - 1)
-        self._refresh_month_hours()
+        self._schedule_month_hours_refresh()
 
     def _sync_month_year_from_date(self, d: date) -> None:
         self.cal_year_combo.setCurrentText(str(d.year))
@@ -1478,28 +1718,44 @@ class TimesheetWindow(QMainWindow):
         self.qt_calendar.setSelectedDate(_to_qdate(new_date))
         self.selected_date_label.setText(f"Data selezionata: {new_date.isoformat()}")
         self._clear_timesheet_form()
-        self.refresh_day_entries()
-        self._refresh_month_hours()
+        # Selezioni ravvicinate (frecce, Oggi, Mostra) ricaricano la tabella del giorno una volta sola.
+        self._schedule_refresh("day")
+        # Cambiare giorno nello stesso mese non cambia i totali mensili già caricati.
+        if (new_date.year, new_date.month) != self._month_hours_page:
+            self._schedule_month_hours_refresh()
+
+    def _schedule_month_hours_refresh(self) -> None:
+        # Click ravvicinati su navigazione/selezione producono una sola query sul mese.
+        self.month_hours_timer.start()
 
     def _refresh_month_hours(self) -> None:
         year = self.qt_calendar.yearShown()
         month = self.qt_calendar.monthShown()
+        self._month_hours_page = (year, month)
         user_id = int(self.current_user["id"])
-        summary = self.db.get_month_hours_summary(year, month, user_id=user_id)
+        # Tornare su un mese già visto senza modifiche al DB non rilancia la query aggregata.
+        token = self.db.change_token()
+        if token != self._month_hours_cache_token or len(self._month_hours_cache) >= 12:
+            self._month_hours_cache.clear()
+            self._month_hours_cache_token = token
+        key = (year, month, user_id)
+        summary = self._month_hours_cache.get(key)
+        if summary is None:
+            summary = self._month_hours_cache[key] = self.db.get_month_hours_summary(year, month, user_id=user_id)
         total = sum(float(v) for v in summary.values())
         self.month_hours_label.setText(f"Totale mese: {total:.2f} h")
         self.qt_calendar.set_hours_map(summary)
 
     def _clear_timesheet_form(self) -> None:
-        if hasattr(self, "ts_client_combo"):
+        if self.ts_client_combo is not None:
             self.ts_client_combo.setCurrentIndex(0)
-        if hasattr(self, "ts_project_combo"):
+        if self.ts_project_combo is not None:
             self.ts_project_combo.setCurrentIndex(0)
-        if hasattr(self, "ts_activity_combo"):
+        if self.ts_activity_combo is not None:
             self.ts_activity_combo.setCurrentIndex(0)
-        if hasattr(self, "ts_hours_entry"):
+        if self.ts_hours_entry is not None:
             self.ts_hours_entry.clear()
-        if hasattr(self, "ts_note_text"):
+        if self.ts_note_text is not None:
             self.ts_note_text.clear()
 
     def show_selected_month(self) -> None:
@@ -1512,31 +1768,58 @@ class TimesheetWindow(QMainWindow):
         self._set_calendar_date(date(year, month, 1))
 
     def goto_prev_month(self) -> None:
+        # Il cambio pagina emette currentPageChanged, che pianifica l'aggiornamento delle ore.
         self.qt_calendar.showPreviousMonth()
-        self._refresh_month_hours()
 
     def goto_today(self) -> None:
         self._set_calendar_date(date.today())
 
     def goto_next_month(self) -> None:
         self.qt_calendar.showNextMonth()
-        self._refresh_month_hours()
 
     def _selected_timesheet_user_id(self) -> int:
         return int(self.current_user["id"])
 
+    def _cached_options(self, key: tuple[Any, ...], build: Callable[[], _OptionsT]) -> _OptionsT:
+        """Opzioni combo memoizzate per chiave; la cache si svuota a ogni modifica del database."""
+        token = self.db.change_token()
+        if token != self._option_cache_token or len(self._option_cache) >= 64:
+            self._option_cache.clear()
+            self._option_cache_token = token
+        values = self._option_cache.get(key)
+        if values is None:
+            values = self._option_cache[key] = build()
+        return values
+
+    def _timesheet_project_options(self, user_id: int | None, today: str) -> dict[int, list[str]]:
+        """Opzioni commessa per cliente, lette con una sola query per tutti i clienti."""
+
+        def build() -> dict[int, list[str]]:
+            by_client: dict[int, list[str]] = defaultdict(lambda: [""])
+            for p in self.db.list_projects(only_with_open_schedules=True, user_id=user_id, available_from_date=today):
+                by_client[p["client_id"]].append(p["display"])
+            return dict(by_client)
+
+        return self._cached_options(("projects_by_client", user_id, today), build)
+
+    def _timesheet_activity_options(self, today: str) -> dict[int, list[str]]:
+        """Opzioni attività per commessa, lette con una sola query per tutte le commesse."""
+
+        def build() -> dict[int, list[str]]:
+            by_project: dict[int, list[str]] = defaultdict(lambda: [""])
+            for a in self.db.list_activities(only_with_open_schedules=True, available_from_date=today):
+                by_project[a["project_id"]].append(a["display"])
+            return dict(by_project)
+
+        return self._cached_options(("activities_by_project", today), build)
+
     def on_timesheet_client_change(self, _value: str) -> None:
         client_id = self._id_from_option(self.ts_client_combo.currentText())
         if client_id:
             user_id = None if self.is_admin else int(self.current_user["id"])
             today = date.today().isoformat()
-            projects = self.db.list_projects(
-                client_id=client_id,
-                only_with_open_schedules=True,
-                user_id=user_id,
-                available_from_date=today,
-            )
-            self._set_combo_values(self.ts_project_combo, [""] + [self._project_option(p) for p in projects])
+            values = self._timesheet_project_options(user_id, today).get(client_id, [""])
+            self._set_combo_values(self.ts_project_combo, values)
             self.ts_project_combo.setCurrentIndex(0)
         else:
             self._set_combo_values(self.ts_project_combo, [""])
@@ -1546,12 +1829,8 @@ class TimesheetWindow(QMainWindow):
         project_id = self._id_from_option(self.ts_project_combo.currentText())
         if project_id:
             today = date.today().isoformat()
-            activities = self.db.list_activities(
-                project_id=project_id,
-                only_with_open_schedules=True,
-                available_from_date=today,
-            )
-            self._set_combo_values(self.ts_activity_combo, [""] + [self._activity_option(a) for a in activities])
+            values = self._timesheet_activity_options(today).get(project_id, [""])
+            self._set_combo_values(self.ts_activity_combo, values)
             self.ts_activity_combo.setCurrentIndex(0)
         else:
             self._set_combo_values(self.ts_activity_combo, [""])
@@ -1588,57 +1867,68 @@ class TimesheetWindow(QMainWindow):
 
         self.ts_hours_entry.clear()
         self.ts_note_text.clear()
-        self.refresh_day_entries()
-        self._refresh_month_hours()
-        self.refresh_control_panel()
+        self._schedule_refresh("day", "month", "control")
         QMessageBox.information(self, "Ore giornaliere", "Inserimento completato.")
 
+    def _schedule_refresh(self, *keys: str) -> None:
+        """Accoda i refresh indicati ("master", "day", "month", "control") al prossimo giro del ciclo di eventi."""
+        self._pending_refreshes.update(keys)
+        if not self.refresh_timer.isActive():
+            self.refresh_timer.start()
+
+    def _run_pending_refreshes(self) -> None:
+        pending, self._pending_refreshes = self._pending_refreshes, set()
+        if "master" in pending:
+            # refresh_master_data ricarica già alberi, giornata e pannello controllo.
+            self.refresh_master_data()
+            pending -= {"day", "control"}
+        if "day" in pending:
+            self.refresh_day_entries()
+        if "month" in pending:
+            self._refresh_month_hours()
+        if "control" in pending:
+            self.refresh_control_panel()
+
     def refresh_day_entries(self) -> None:
-        if not hasattr(self, "ts_table"):
+        if self.ts_table is None:
             return
 
-        self._timesheet_rows_by_id = {}
-        self.ts_table.setRowCount(0)
-
         user_id = int(self.current_user["id"])
-        rows = self.db.list_timesheets_for_day(self.selected_date.isoformat(), user_id=user_id)
-        total_hours = 0.0
-        total_cost = 0.0
+        # Stessa data, stesso utente e nessuna scrittura sul DB: la tabella è già aggiornata.
+        signature = (self.selected_date, user_id, self.db.change_token())
+        if signature == self._day_entries_sig:
+            self.ts_table.clearSelection()
+            return
+        self._day_entries_sig = signature
 
-        for row in rows:
-            entry_id = int(row["id"])
-            self._timesheet_rows_by_id[entry_id] = row
-            total_hours += float(row["hours"])
-            total_cost += float(row["cost"])
-
-            idx = self.ts_table.rowCount()
-            self.ts_table.insertRow(idx)
-            if self.is_admin:
-                data = [
-                    entry_id,
-                    row["username"],
-                    row["client_name"],
-                    row["project_name"],
-                    row["activity_name"],
-                    f"{row['hours']:.2f}",
-                    f"{row['effective_rate']:.2f}",
-                    f"{row['cost']:.2f}",
-                    row["note"] or "",
-                ]
-            else:
+        rows = self.db.list_timesheets_for_day(self.selected_date.isoformat(), user_id=user_id)
+        is_admin = self.is_admin
+
+        self._timesheet_rows_by_id = {int(row["id"]): TimesheetRow.from_db(row) for row in rows}
+        total_hours = sum(float(row["hours"]) for row in rows)
+        total_cost = sum(float(row["cost"]) for row in rows) if is_admin else 0.0
+
+        # Lo svuotamento non deve rilanciare on_timesheet_table_select; un solo ridisegno a fine riempimento.
+        with _bulk_update(self.ts_table):
+            self.ts_table.setRowCount(0)
+            # Righe allocate in un colpo solo: la vista disegna comunque solo quelle visibili.
+            self.ts_table.setRowCount(len(rows))
+            for idx, row in enumerate(rows):
                 data = [
-                    entry_id,
+                    row["id"],
                     row["username"],
                     row["client_name"],
                     row["project_name"],
                     row["activity_name"],
                     f"{row['hours']:.2f}",
+                    f"{row['effective_rate']:.2f}" if is_admin else "",
+                    f"{row['cost']:.2f}" if is_admin else "",
                     row["note"] or "",
                 ]
-            for col, value in enumerate(data):
-                self.ts_table.setItem(idx, col, _readonly_item(value))
+                for col, value in enumerate(data):
+                    self.ts_table.setItem(idx, col, _readonly_item(value))
 
-        if self.is_admin:
+        if is_admin:
             self.day_total_label.setText(f"Totale giornata: {total_hours:.2f} h | {total_cost:.2f} EUR")
         else:
             self.day_total_label.setText(f"Totale giornata: {total_hours:.2f} h")
@@ -1651,26 +1941,22 @@ class TimesheetWindow(QMainWindow):
         if not row:
             return
 
-        client_option = self._entity_option(row["client_id"], row["client_name"])
+        client_option = row.client_display
         self._ensure_combo_option(self.ts_client_combo, client_option)
         self.ts_client_combo.setCurrentText(client_option)
         self.on_timesheet_client_change(client_option)
 
-        project_option = self._project_option(
-            {"id": row["project_id"], "client_name": row["client_name"], "name": row["project_name"]}
-        )
+        project_option = row.project_display
         self._ensure_combo_option(self.ts_project_combo, project_option)
         self.ts_project_combo.setCurrentText(project_option)
         self.on_timesheet_project_change(project_option)
 
-        activity_option = self._activity_option(
-            {"id": row["activity_id"], "project_name": row["project_name"], "name": row["activity_name"]}
-        )
+        activity_option = row.activity_display
         self._ensure_combo_option(self.ts_activity_combo, activity_option)
         self.ts_activity_combo.setCurrentText(activity_option)
 
-        self.ts_hours_entry.setText(f"{float(row['hours']):.2f}")
-        self.ts_note_text.setPlainText(row.get("note", "") or "")
+        self.ts_hours_entry.setText(f"{row.hours:.2f}")
+        self.ts_note_text.setPlainText(row.note)
 
     def edit_selected_timesheet(self) -> None:
         entry_id = self._selected_table_id(self.ts_table)
@@ -1708,9 +1994,7 @@ class TimesheetWindow(QMainWindow):
             QMessageBox.critical(self, "Ore giornaliere", str(exc))
             return
 
-        self.refresh_day_entries()
-        self._refresh_month_hours()
-        self.refresh_control_panel()
+        self._schedule_refresh("day", "month", "control")
         QMessageBox.information(self, "Ore giornaliere", "Voce aggiornata.")
 
     def delete_selected_timesheet(self) -> None:
@@ -1722,9 +2006,7 @@ class TimesheetWindow(QMainWindow):
             return
 
         self.db.delete_timesheet(entry_id, int(self.current_user["id"]), self.is_admin)
-        self.refresh_day_entries()
-        self._refresh_month_hours()
-        self.refresh_control_panel()
+        self._schedule_refresh("day", "month", "control")
 
     # Gestione Commesse
     def build_project_management_tab(self) -> None:
@@ -1761,7 +2043,12 @@ class TimesheetWindow(QMainWindow):
 
         self.project_search_entry = QLineEdit()
         self.project_search_entry.setPlaceholderText("Filtra commesse...")
-        self.project_search_entry.textChanged.connect(self.filter_projects_tree)
+        # Filtro applicato 150 ms dopo l'ultimo tasto: una raffica di digitazioni produce un solo rebuild.
+        self.project_filter_timer = QTimer(self.tab_master)
+        self.project_filter_timer.setSingleShot(True)
+        self.project_filter_timer.setInterval(150)
+        self.project_filter_timer.timeout.connect(self.filter_projects_tree)
+        self.project_search_entry.textChanged.connect(lambda _text: self.project_filter_timer.start())
         project_actions.addWidget(self.project_search_entry)
 
         self.show_closed_projects = QCheckBox("Mostra chiuse")
@@ -1813,7 +2100,11 @@ class TimesheetWindow(QMainWindow):
 
         self.activity_search_entry = QLineEdit()
         self.activity_search_entry.setPlaceholderText("Filtra attivita...")
-        self.activity_search_entry.textChanged.connect(self.filter_activities_tree)
+        self.activity_filter_timer = QTimer(self.tab_master)
+        self.activity_filter_timer.setSingleShot(True)
+        self.activity_filter_timer.setInterval(150)
+        self.activity_filter_timer.timeout.connect(self.filter_activities_tree)
+        self.activity_search_entry.textChanged.connect(lambda _text: self.activity_filter_timer.start())
         activity_actions.addWidget(self.activity_search_entry)
 
         self.pm_new_activity_btn = QPushButton("Nuova attivita")
@@ -1872,40 +2163,37 @@ class TimesheetWindow(QMainWindow):
         self.refresh_activities_tree()
 
     def refresh_projects_tree(self) -> None:
-        if not hasattr(self, "projects_table"):
+        if self.projects_table is None:
             return
 
         client_id = self._id_from_option(self.pm_client_combo.currentText())
         self._projects_data = []
         if not client_id:
-            self.filter_projects_tree()
+            self._fill_projects_table()
             return
 
-        projects = self.db.list_projects(client_id=client_id)
-        schedules = self.db.list_schedules()
-        show_closed = self.show_closed_projects.isChecked()
+        # Commesse e programmazione di commessa arrivano già unite dalla query (LEFT JOIN);
+        # le chiuse, se nascoste, vengono escluse direttamente dal DB.
+        projects = self.db.list_projects_with_schedule(client_id, include_closed=self.show_closed_projects.isChecked())
 
         for project in projects:
-            project_schedule = next((s for s in schedules if s["project_id"] == project["id"] and s["activity_id"] is None), None)
-            if project_schedule:
-                is_closed = project_schedule.get("status", "aperta") == "chiusa"
+            has_schedule = project["schedule_id"] is not None
+            if has_schedule:
+                is_closed = (project["schedule_status"] or "aperta") == "chiusa"
             else:
                 is_closed = bool(project.get("closed", 0))
 
-            if is_closed and not show_closed:
-                continue
-
             state_text = "Chiusa" if is_closed else "Aperta"
             period = "--"
             planned_hours = "--"
             budget = "--"
             referente = project.get("referente_commessa", "--") or "--"
-            if project_schedule:
-                start = self.format_date_ui(project_schedule["start_date"])
-                end = self.format_date_ui(project_schedule["end_date"])
+            if has_schedule:
+                start = self.format_date_ui(project["schedule_start_date"])
+                end = self.format_date_ui(project["schedule_end_date"])
                 period = f"{start} - {end}"
-                planned_hours = f"{project_schedule['planned_hours']:.1f}"
-                budget = f"{project_schedule.get('budget', 0.0):.2f}"
+                planned_hours = f"{project['schedule_planned_hours']:.1f}"
+                budget = f"{project['schedule_budget'] or 0.0:.2f}"
 
             self._projects_data.append(
                 {
@@ -1917,58 +2205,93 @@ class TimesheetWindow(QMainWindow):
                     "hours": planned_hours,
                     "budget": budget,
                     "is_closed": is_closed,
+                    "search_blob": f"{project['name']} {state_text} {referente} {period} {planned_hours} {budget}".lower(),
                 }
             )
-        self.filter_projects_tree()
+        self._fill_projects_table()
+
+    def _apply_row_filter(self, table: QTableWidget, data: list[dict[str, Any]], text: str, previous_text: str = "") -> bool:
+        """Nasconde le righe il cui search_blob non contiene tutte le parole del testo (solo quelle che cambiano stato).
+
+        Se il testo estende quello precedente le righe già nascoste restano tali e non vengono riesaminate.
+        Restituisce True se la riga selezionata è stata nascosta (selezione azzerata).
+        """
+        narrowing = bool(previous_text) and text.startswith(previous_text)
+        terms = tuple(text.split())
+        # Caso comune di una sola parola: confronto diretto, senza generatore per riga.
+        needle = terms[0] if len(terms) == 1 else None
+        for idx, row in enumerate(data):
+            if narrowing and table.isRowHidden(idx):
+                continue
+            blob = row["search_blob"]
+            if needle is not None:
+                hidden = needle not in blob
+            else:
+                hidden = bool(terms) and not all(term in blob for term in terms)
+            if table.isRowHidden(idx) != hidden:
+                table.setRowHidden(idx, hidden)
+        selected = table.selectionModel().selectedRows()
+        if selected and table.isRowHidden(selected[0].row()):
+            table.clearSelection()
+            return True
+        return False
 
-    def filter_projects_tree(self) -> None:
-        if not hasattr(self, "projects_table"):
-            return
-        text = self.project_search_entry.text().strip().lower() if hasattr(self, "project_search_entry") else ""
+    def _fill_projects_table(self) -> None:
+        # Ricostruzione senza segnali di selezione intermedi (svuotamento + riselezione):
+        # il handler viene richiamato una sola volta alla fine, se c'era o c'è una selezione.
         current_id = self._selected_table_id(self.projects_table)
+        closed_color = QColor("gray")
+        with _bulk_update(self.projects_table):
+            self.projects_table.setRowCount(0)
+            self.projects_table.setRowCount(len(self._projects_data))
+            for idx, row in enumerate(self._projects_data):
+                values = [row["id"], row["name"], row["state"], row["referente"], row["period"], row["hours"], row["budget"]]
+                for col, value in enumerate(values):
+                    item = _readonly_item(value)
+                    if row["is_closed"]:
+                        item.setForeground(closed_color)
+                    self.projects_table.setItem(idx, col, item)
+                if row["id"] == current_id:
+                    self.projects_table.selectRow(idx)
+            self._project_filter_applied = self._project_filter_text()
+            self._apply_row_filter(self.projects_table, self._projects_data, self._project_filter_applied)
+        if current_id or self._selected_table_id(self.projects_table):
+            self.on_pm_projects_tree_select()
+
+    def _project_filter_text(self) -> str:
+        return self.project_search_entry.text().strip().lower() if self.project_search_entry is not None else ""
 
-        self.projects_table.setRowCount(0)
-        for row in self._projects_data:
-            haystack = f"{row['name']} {row['state']} {row['referente']} {row['period']} {row['hours']} {row['budget']}".lower()
-            if text and text not in haystack:
-                continue
-            idx = self.projects_table.rowCount()
-            self.projects_table.insertRow(idx)
-            values = [row["id"], row["name"], row["state"], row["referente"], row["period"], row["hours"], row["budget"]]
-            for col, value in enumerate(values):
-                item = _readonly_item(value)
-                if row["is_closed"]:
-                    item.setForeground(QColor("gray"))
-                self.projects_table.setItem(idx, col, item)
-
-        if current_id:
-            for r in range(self.projects_table.rowCount()):
-                cell = self.projects_table.item(r, 0)
-                if cell and cell.text() == str(current_id):
-                    self.projects_table.selectRow(r)
-                    break
+    def filter_projects_tree(self) -> None:
+        if self.projects_table is None:
+            return
+        # Le righe restano nella tabella: il filtro ne cambia solo la visibilità.
+        text = self._project_filter_text()
+        with _bulk_update(self.projects_table):
+            selection_lost = self._apply_row_filter(self.projects_table, self._projects_data, text, self._project_filter_applied)
+        self._project_filter_applied = text
+        if selection_lost:
+            self.on_pm_projects_tree_select()
 
     def refresh_activities_tree(self) -> None:
-        if not hasattr(self, "activities_table"):
+        if self.activities_table is None:
             return
         self._activities_data = []
         if not self.selected_project_id:
-            self.filter_activities_tree()
+            self._fill_activities_table()
             return
 
-        activities = self.db.list_activities(self.selected_project_id)
-        schedules = self.db.list_schedules()
+        activities = self.db.list_activities_with_schedule(self.selected_project_id)
 
         for activity in activities:
             period = "--"
             planned_hours = "--"
             budget = "--"
-            schedule = next((s for s in schedules if s["project_id"] == self.selected_project_id and s["activity_id"] == activity["id"]), None)
-            if schedule:
-                period = f"{self.format_date_ui(schedule['start_date'])} - {self.format_date_ui(schedule['end_date'])}"
-                planned_hours = f"{schedule['planned_hours']:.1f}"
-                budget = f"{schedule.get('budget', 0.0):.2f}"
+            if activity["schedule_id"] is not None:
+                period = f"{self.format_date_ui(activity['schedule_start_date'])} - {self.format_date_ui(activity['schedule_end_date'])}"
+                planned_hours = f"{activity['schedule_planned_hours']:.1f}"
+                budget = f"{activity['schedule_budget'] or 0.0:.2f}"
 
+            rate = f"{float(activity['hourly_rate']):.2f}"
             self._activities_data.append(
                 {
                     "id": int(activity["id"]),
@@ -1976,34 +2299,41 @@ class TimesheetWindow(QMainWindow):
                     "period": period,
                     "hours": planned_hours,
                     "budget": budget,
-                    "rate": f"{float(activity['hourly_rate']):.2f}",
+                    "rate": rate,
+                    # Testo di ricerca già in minuscolo: il filtro non lo ricostruisce a ogni tasto.
+                    "search_blob": f"{activity['name']} {period} {planned_hours} {budget} {rate}".lower(),
                 }
             )
-        self.filter_activities_tree()
+        self._fill_activities_table()
 
-    def filter_activities_tree(self) -> None:
-        if not hasattr(self, "activities_table"):
-            return
-        text = self.activity_search_entry.text().strip().lower() if hasattr(self, "activity_search_entry") else ""
+    def _fill_activities_table(self) -> None:
         current_id = self._selected_table_id(self.activities_table)
+        with _bulk_update(self.activities_table):
+            self.activities_table.setRowCount(0)
+            self.activities_table.setRowCount(len(self._activities_data))
+            for idx, row in enumerate(self._activities_data):
+                values = [row["id"], row["name"], row["period"], row["hours"], row["budget"], row["rate"]]
+                for col, value in enumerate(values):
+                    self.activities_table.setItem(idx, col, _readonly_item(value))
+                if row["id"] == current_id:
+                    self.activities_table.selectRow(idx)
+            self._activity_filter_applied = self._activity_filter_text()
+            self._apply_row_filter(self.activities_table, self._activities_data, self._activity_filter_applied)
+        if current_id or self._selected_table_id(self.activities_table):
+            self.on_pm_activities_tree_select()
+
+    def _activity_filter_text(self) -> str:
+        return self.activity_search_entry.text().strip().lower() if self.activity_search_entry is not None else ""
 
-        self.activities_table.setRowCount(0)
-        for row in self._activities_data:
-            haystack = f"{row['name']} {row['period']} {row['hours']} {row['budget']} {row['rate']}".lower()
-            if text and text not in haystack:
-                continue
-            idx = self.activities_table.rowCount()
-            self.activities_table.insertRow(idx)
-            values = [row["id"], row["name"], row["period"], row["hours"], row["budget"], row["rate"]]
-            for col, value in enumerate(values):
-                self.activities_table.setItem(idx, col, _readonly_item(value))
-
-        if current_id:
-            for r in range(self.activities_table.rowCount()):
-                cell = self.activities_table.item(r, 0)
-                if cell and cell.text() == str(current_id):
-                    self.activities_table.selectRow(r)
-                    break
+    def filter_activities_tree(self) -> None:
+        if self.activities_table is None:
+            return
+        text = self._activity_filter_text()
+        with _bulk_update(self.activities_table):
+            selection_lost = self._apply_row_filter(self.activities_table, self._activities_data, text, self._activity_filter_applied)
+        self._activity_filter_applied = text
+        if selection_lost:
+            self.on_pm_activities_tree_select()
 
     def on_pm_projects_tree_select(self) -> None:
         project_id = self._selected_table_id(self.projects_table)
@@ -2016,8 +2346,7 @@ class TimesheetWindow(QMainWindow):
             return
 
         project = self.db.get_project(project_id)
-        schedules = self.db.list_schedules()
-        project_schedule = next((s for s in schedules if s["project_id"] == project_id and s["activity_id"] is None), None)
+        project_schedule = self.db.get_schedule_for(project_id, None)
         is_closed = False
         if project_schedule:
             is_closed = project_schedule.get("status", "aperta") == "chiusa"
@@ -2074,7 +2403,7 @@ class TimesheetWindow(QMainWindow):
         self.project_info_text.setPlainText("\n".join(lines))
 
     def clear_project_info_box(self) -> None:
-        if hasattr(self, "project_info_text"):
+        if self.project_info_text is not None:
             self.project_info_text.setPlainText("Nessuna commessa selezionata")
 
     def update_activity_info_box(self) -> None:
@@ -2092,8 +2421,7 @@ class TimesheetWindow(QMainWindow):
         notes = (activity.get("notes") or "").strip()
         if notes:
             lines.append(f"Note: {notes}")
-        schedules = self.db.list_schedules()
-        schedule = next((s for s in schedules if s["project_id"] == self.selected_project_id and s["activity_id"] == self.selected_activity_id), None)
+        schedule = self.db.get_schedule_for(self.selected_project_id, self.selected_activity_id)
         if schedule:
             lines.extend(
                 [
@@ -2109,9 +2437,9 @@ class TimesheetWindow(QMainWindow):
         self.load_activity_users()
 
     def clear_activity_info_box(self) -> None:
-        if hasattr(self, "activity_info_text"):
+        if self.activity_info_text is not None:
             self.activity_info_text.setPlainText("Nessuna attivita selezionata")
-        if hasattr(self, "activity_users_list"):
+        if self.activity_users_list is not None:
             self.activity_users_list.clear()
 
     def load_activity_users(self) -> None:
@@ -2119,12 +2447,10 @@ class TimesheetWindow(QMainWindow):
             self.activity_users_list.clear()
             return
         self.activity_users_list.clear()
-        assignments = self.db.get_user_project_assignments(self.selected_project_id)
-        for assignment in assignments:
-            if assignment.get("activity_id") == self.selected_activity_id:
-                item = QListWidgetItem(f"{assignment['full_name']} ({assignment['username']})")
-                item.setData(Qt.ItemDataRole.UserRole, int(assignment["user_id"]))
-                self.activity_users_list.addItem(item)
+        for assignment in self.db.get_activity_assignments(self.selected_project_id, self.selected_activity_id):
+            item = QListWidgetItem(f"{assignment['full_name']} ({assignment['username']})")
+            item.setData(Qt.ItemDataRole.UserRole, int(assignment["user_id"]))
+            self.activity_users_list.addItem(item)
 
     def add_user_to_activity(self) -> None:
         if not (self.selected_project_id and self.selected_activity_id):
@@ -2132,8 +2458,8 @@ class TimesheetWindow(QMainWindow):
             return
 
         all_users = self.db.list_users(include_inactive=False)
-        assignments = self.db.get_user_project_assignments(self.selected_project_id)
-        assigned_ids = {int(a["user_id"]) for a in assignments if a.get("activity_id") == self.selected_activity_id}
+        assignments = self.db.get_activity_assignments(self.selected_project_id, self.selected_activity_id)
+        assigned_ids = {int(a["user_id"]) for a in assignments}
         options = [u for u in all_users if int(u["id"]) not in assigned_ids]
         if not options:
             QMessageBox.information(self, "Assegnazione", "Tutti gli utenti sono gia assegnati a questa attivita.")
@@ -2191,7 +2517,7 @@ class TimesheetWindow(QMainWindow):
         if not client_id:
             QMessageBox.information(self, "Clienti", "Seleziona prima un cliente.")
             return
-        client = next((c for c in self.db.list_clients() if c["id"] == client_id), None)
+        client = self.db.get_client(client_id)
         if not client:
             QMessageBox.critical(self, "Clienti", "Cliente non trovato.")
             return
@@ -2231,7 +2557,7 @@ class TimesheetWindow(QMainWindow):
             QMessageBox.information(self, "Commesse", "Seleziona prima un cliente.")
             return
 
-        client = next((c for c in self.db.list_clients() if c["id"] == client_id), None)
+        client = self.db.get_client(client_id)
         if not client:
             QMessageBox.critical(self, "Commesse", "Cliente non trovato.")
             return
@@ -2289,9 +2615,7 @@ class TimesheetWindow(QMainWindow):
                     budget=planning["budget"],
                 )
 
-            self.refresh_master_data()
-            self.refresh_projects_tree()
-            self.refresh_control_panel()
+            self._schedule_refresh("master")
             QMessageBox.information(self, "Commesse", "Commessa creata.")
         except sqlite3.IntegrityError as exc:
             if "UNIQUE constraint" in str(exc):
@@ -2314,11 +2638,7 @@ class TimesheetWindow(QMainWindow):
             QMessageBox.critical(self, "Commesse", "Commessa non trovata.")
             return
 
-        schedules = self.db.list_schedules()
-        project_schedule = next(
-            (s for s in schedules if s["project_id"] == project_id and s["activity_id"] is None),
-            None,
-        )
+        project_schedule = self.db.get_schedule_for(project_id, None)
         is_closed = False
         if project_schedule:
             is_closed = project_schedule.get("status", "aperta") == "chiusa"
@@ -2392,9 +2712,7 @@ class TimesheetWindow(QMainWindow):
                 if answer == QMessageBox.StandardButton.Yes:
                     self.db.delete_schedule(int(project_schedule["id"]))
 
-            self.refresh_master_data()
-            self.refresh_projects_tree()
-            self.refresh_control_panel()
+            self._schedule_refresh("master")
             QMessageBox.information(self, "Commesse", "Commessa aggiornata.")
         except sqlite3.IntegrityError as exc:
             if "UNIQUE constraint" in str(exc):
@@ -2429,8 +2747,7 @@ class TimesheetWindow(QMainWindow):
             return
         try:
             self.db.close_project(project_id)
-            self.refresh_master_data()
-            self.refresh_projects_tree()
+            self._schedule_refresh("master")
             QMessageBox.information(self, "Commesse", "Commessa chiusa.")
         except Exception as exc:
             QMessageBox.critical(self, "Commesse", str(exc))
@@ -2442,8 +2759,7 @@ class TimesheetWindow(QMainWindow):
             return
         try:
             self.db.open_project(project_id)
-            self.refresh_master_data()
-            self.refresh_projects_tree()
+            self._schedule_refresh("master")
             QMessageBox.information(self, "Commesse", "Commessa riaperta.")
         except Exception as exc:
             QMessageBox.critical(self, "Commesse", str(exc))
@@ -2458,11 +2774,7 @@ class TimesheetWindow(QMainWindow):
             QMessageBox.critical(self, "Attivita", "Commessa non trovata.")
             return
 
-        schedules = self.db.list_schedules()
-        project_schedule = next(
-            (s for s in schedules if s["project_id"] == self.selected_project_id and s["activity_id"] is None),
-            None,
-        )
+        project_schedule = self.db.get_schedule_for(self.selected_project_id, None)
         is_project_closed = False
         if project_schedule:
             is_project_closed = project_schedule.get("status", "aperta") == "chiusa"
@@ -2505,14 +2817,11 @@ class TimesheetWindow(QMainWindow):
 
             warnings: list[str] = []
             if planning["has_any_planning"]:
-                project_schedule_check = next(
-                    (s for s in schedules if s["project_id"] == self.selected_project_id and s["activity_id"] is None),
-                    None,
-                )
-                if project_schedule_check:
-                    project_end_date = project_schedule_check["end_date"]
-                    project_planned_hours = float(project_schedule_check.get("planned_hours", 0.0))
-                    project_budget = float(project_schedule_check.get("budget", 0.0))
+                # Programmazione di commessa già letta all'apertura del dialogo: nessuna nuova ricerca.
+                if project_schedule:
+                    project_end_date = project_schedule["end_date"]
+                    project_planned_hours = float(project_schedule.get("planned_hours", 0.0))
+                    project_budget = float(project_schedule.get("budget", 0.0))
 
                     if planning["end_date"] > project_end_date:
                         warnings.append(
@@ -2520,45 +2829,45 @@ class TimesheetWindow(QMainWindow):
                             f"({self.format_date_ui(planning['end_date'])} > {self.format_date_ui(project_end_date)})."
                         )
 
-                    activity_schedules = [
-                        s for s in schedules if s["project_id"] == self.selected_project_id and s["activity_id"] is not None
-                    ]
-                    total_hours = sum(float(s.get("planned_hours", 0.0)) for s in activity_schedules)
-                    total_budget = sum(float(s.get("budget", 0.0)) for s in activity_schedules)
-                    total_hours += planning["planned_hours"]
-                    total_budget += planning["budget"]
-
-                    if project_planned_hours > 0 and total_hours > project_planned_hours:
-                        warnings.append(
-                            f"Ore totali attivita ({total_hours:.1f}h) superiori alle ore commessa ({project_planned_hours:.1f}h)."
-                        )
-                    if project_budget > 0 and total_budget > project_budget:
-                        warnings.append(
-                            f"Budget totale attivita ({total_budget:.2f} EUR) superiore al budget commessa ({project_budget:.2f} EUR)."
-                        )
-
-            new_activity_id = self.db.add_activity(
-                project_id=self.selected_project_id,
-                name=name,
-                hourly_rate=rate,
-                notes=values["notes"],
-            )
-            self.selected_activity_id = new_activity_id
-
-            if planning["has_any_planning"]:
-                self.db.add_schedule(
+                    # Senza limiti di ore o budget sulla commessa i totali non servono.
+                    if project_planned_hours > 0 or project_budget > 0:
+                        # Totali delle attività della commessa calcolati da SQLite.
+                        total_hours, total_budget = self.db.get_activity_schedule_totals(self.selected_project_id)
+                        total_hours += planning["planned_hours"]
+                        total_budget += planning["budget"]
+
+                        if project_planned_hours > 0 and total_hours > project_planned_hours:
+                            warnings.append(
+                                f"Ore totali attivita ({total_hours:.1f}h) superiori alle ore commessa ({project_planned_hours:.1f}h)."
+                            )
+                        if project_budget > 0 and total_budget > project_budget:
+                            warnings.append(
+                                f"Budget totale attivita ({total_budget:.2f} EUR) superiore al budget commessa ({project_budget:.2f} EUR)."
+                            )
+
+            # Attività e programmazione salvate con un solo commit.
+            with self.db.transaction():
+                new_activity_id = self.db.add_activity(
                     project_id=self.selected_project_id,
-                    activity_id=new_activity_id,
-                    start_date=planning["start_date"],
-                    end_date=planning["end_date"],
-                    planned_hours=planning["planned_hours"],
-                    note="",
-                    budget=planning["budget"],
+                    name=name,
+                    hourly_rate=rate,
+                    notes=values["notes"],
                 )
 
-            self.refresh_activities_tree()
-            self.refresh_master_data()
-            self.refresh_control_panel()
+                if planning["has_any_planning"]:
+                    self.db.add_schedule(
+                        project_id=self.selected_project_id,
+                        activity_id=new_activity_id,
+                        start_date=planning["start_date"],
+                        end_date=planning["end_date"],
+                        planned_hours=planning["planned_hours"],
+                        note="",
+                        budget=planning["budget"],
+                    )
+            self.selected_activity_id = new_activity_id
+
+            # Alberi e pannello controllo ricaricati una volta sola, dopo il salvataggio.
+            self._schedule_refresh("master")
             if warnings:
                 QMessageBox.warning(self, "Attivita", "Attivita salvata, ma attenzione:\n\n" + "\n".join(warnings))
             else:
@@ -2585,12 +2894,8 @@ class TimesheetWindow(QMainWindow):
 
         project_id = int(activity["project_id"])
         project = self.db.get_project(project_id)
-        schedules = self.db.list_schedules()
-        project_schedule = next((s for s in schedules if s["project_id"] == project_id and s["activity_id"] is None), None)
-        activity_schedule = next(
-            (s for s in schedules if s["project_id"] == project_id and s["activity_id"] == self.selected_activity_id),
-            None,
-        )
+        project_schedule = self.db.get_schedule_for(project_id, None)
+        activity_schedule = self.db.get_schedule_for(project_id, self.selected_activity_id)
 
         is_project_closed = False
         if project_schedule:
@@ -2632,14 +2937,11 @@ class TimesheetWindow(QMainWindow):
 
             warnings: list[str] = []
             if planning["has_any_planning"]:
-                project_schedule_check = next(
-                    (s for s in schedules if s["project_id"] == project_id and s["activity_id"] is None),
-                    None,
-                )
-                if project_schedule_check:
-                    project_end_date = project_schedule_check["end_date"]
-                    project_planned_hours = float(project_schedule_check.get("planned_hours", 0.0))
-                    project_budget = float(project_schedule_check.get("budget", 0.0))
+                # Programmazione di commessa già letta all'apertura del dialogo: nessuna nuova ricerca.
+                if project_schedule:
+                    project_end_date = project_schedule["end_date"]
+                    project_planned_hours = float(project_schedule.get("planned_hours", 0.0))
+                    project_budget = float(project_schedule.get("budget", 0.0))
 
                     if planning["end_date"] > project_end_date:
                         warnings.append(
@@ -2647,57 +2949,27 @@ class TimesheetWindow(QMainWindow):
                             f"({self.format_date_ui(planning['end_date'])} > {self.format_date_ui(project_end_date)})."
                         )
 
-                    activity_schedules = [s for s in schedules if s["project_id"] == project_id and s["activity_id"] is not None]
-                    total_hours = 0.0
-                    total_budget = 0.0
-                    for sched in activity_schedules:
-                        if int(sched["activity_id"]) == int(self.selected_activity_id):
-                            continue
-                        total_hours += float(sched.get("planned_hours", 0.0))
-                        total_budget += float(sched.get("budget", 0.0))
-
-                    total_hours += planning["planned_hours"]
-                    total_budget += planning["budget"]
-
-                    if project_planned_hours > 0 and total_hours > project_planned_hours:
-                        warnings.append(
-                            f"Ore totali attivita ({total_hours:.1f}h) superiori alle ore commessa ({project_planned_hours:.1f}h)."
+                    # Senza limiti di ore o budget sulla commessa i totali non servono.
+                    if project_planned_hours > 0 or project_budget > 0:
+                        # Totali delle altre attività della commessa calcolati da SQLite.
+                        total_hours, total_budget = self.db.get_activity_schedule_totals(
+                            project_id, exclude_activity_id=int(self.selected_activity_id)
                         )
-                    if project_budget > 0 and total_budget > project_budget:
-                        warnings.append(
-                            f"Budget totale attivita ({total_budget:.2f} EUR) superiore al budget commessa ({project_budget:.2f} EUR)."
-                        )
-
-            self.db.update_activity(
-                activity_id=self.selected_activity_id,
-                name=name,
-                hourly_rate=rate,
-                notes=values["notes"],
-            )
-
-            if planning["has_any_planning"]:
-                if activity_schedule:
-                    self.db.update_schedule(
-                        schedule_id=int(activity_schedule["id"]),
-                        project_id=project_id,
-                        activity_id=self.selected_activity_id,
-                        start_date=planning["start_date"],
-                        end_date=planning["end_date"],
-                        planned_hours=planning["planned_hours"],
-                        note="",
-                        budget=planning["budget"],
-                    )
-                else:
-                    self.db.add_schedule(
-                        project_id=project_id,
-                        activity_id=self.selected_activity_id,
-                        start_date=planning["start_date"],
-                        end_date=planning["end_date"],
-                        planned_hours=planning["planned_hours"],
-                        note="",
-                        budget=planning["budget"],
-                    )
-            elif activity_schedule:
+                        total_hours += planning["planned_hours"]
+                        total_budget += planning["budget"]
+
+                        if project_planned_hours > 0 and total_hours > project_planned_hours:
+                            warnings.append(
+                                f"Ore totali attivita ({total_hours:.1f}h) superiori alle ore commessa ({project_planned_hours:.1f}h)."
+                            )
+                        if project_budget > 0 and total_budget > project_budget:
+                            warnings.append(
+                                f"Budget totale attivita ({total_budget:.2f} EUR) superiore al budget commessa ({project_budget:.2f} EUR)."
+                            )
+
+            # Conferma chiesta prima delle scritture, così la transazione non resta aperta durante il dialogo.
+            delete_activity_schedule = False
+            if not planning["has_any_planning"] and activity_schedule:
                 answer = QMessageBox.question(
                     self,
                     "Attivita",
@@ -2705,13 +2977,45 @@ class TimesheetWindow(QMainWindow):
                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
                     QMessageBox.StandardButton.No,
                 )
-                if answer == QMessageBox.StandardButton.Yes:
+                delete_activity_schedule = answer == QMessageBox.StandardButton.Yes
+
+            # Attività e programmazione salvate con un solo commit.
+            with self.db.transaction():
+                self.db.update_activity(
+                    activity_id=self.selected_activity_id,
+                    name=name,
+                    hourly_rate=rate,
+                    notes=values["notes"],
+                )
+
+                if planning["has_any_planning"]:
+                    if activity_schedule:
+                        self.db.update_schedule(
+                            schedule_id=int(activity_schedule["id"]),
+                            project_id=project_id,
+                            activity_id=self.selected_activity_id,
+                            start_date=planning["start_date"],
+                            end_date=planning["end_date"],
+                            planned_hours=planning["planned_hours"],
+                            note="",
+                            budget=planning["budget"],
+                        )
+                    else:
+                        self.db.add_schedule(
+                            project_id=project_id,
+                            activity_id=self.selected_activity_id,
+                            start_date=planning["start_date"],
+                            end_date=planning["end_date"],
+                            planned_hours=planning["planned_hours"],
+                            note="",
+                            budget=planning["budget"],
+                        )
+                elif delete_activity_schedule:
                     self.db.delete_schedule(int(activity_schedule["id"]))
 
             self.selected_project_id = project_id
-            self.refresh_activities_tree()
-            self.refresh_master_data()
-            self.refresh_control_panel()
+            # Alberi e pannello controllo ricaricati una volta sola, dopo il salvataggio.
+            self._schedule_refresh("master")
             self.update_activity_info_box()
             if warnings:
                 QMessageBox.warning(self, "Attivita", "Attivita salvata, ma attenzione:\n\n" + "\n".join(warnings))
@@ -2736,8 +3040,7 @@ class TimesheetWindow(QMainWindow):
         try:
             self.db.delete_activity(self.selected_activity_id)
             self.selected_activity_id = None
-            self.refresh_activities_tree()
-            self.refresh_master_data()
+            self._schedule_refresh("master")
             self.clear_activity_info_box()
             QMessageBox.information(self, "Attivita", "Attivita eliminata.")
         except Exception as exc:
@@ -2816,18 +3119,18 @@ class TimesheetWindow(QMainWindow):
         layout.addWidget(self.plan_table, 1)
 
     def refresh_programming_options(self) -> None:
-        if not hasattr(self, "plan_project_combo"):
+        if self.plan_project_combo is None:
             return
         projects = self.db.list_projects()
-        self._set_combo_values(self.plan_project_combo, [self._project_option(p) for p in projects])
+        self._set_combo_values(self.plan_project_combo, [p["display"] for p in projects])
         self.on_plan_project_change(self.plan_project_combo.currentText())
 
     def on_plan_project_change(self, _value: str) -> None:
-        if not hasattr(self, "plan_activity_combo"):
+        if self.plan_activity_combo is None:
             return
         project_id = self._id_from_option(self.plan_project_combo.currentText())
         activities = self.db.list_activities(project_id)
-        options = ["(Tutta la commessa)"] + [self._activity_option(a) for a in activities]
+        options = ["(Tutta la commessa)"] + [a["display"] for a in activities]
         self._set_combo_values(self.plan_activity_combo, options)
         self.plan_activity_combo.setCurrentText("(Tutta la commessa)")
 
@@ -2869,24 +3172,20 @@ class TimesheetWindow(QMainWindow):
         schedule_id = self._selected_table_id(self.plan_table)
         if not schedule_id:
             return
-        schedules = self.db.list_schedules()
-        schedule = next((s for s in schedules if s["id"] == schedule_id), None)
+        # Riga già letta da refresh_schedule_list: nessuna nuova query.
+        schedule = self._schedule_rows_by_id.get(schedule_id)
         if not schedule:
             return
 
-        project_option = self._project_option({"id": schedule["project_id"], "name": schedule["project_name"], "client_name": schedule["client_name"]})
+        project_option = schedule["project_display"]
         self._ensure_combo_option(self.plan_project_combo, project_option)
         self.plan_project_combo.setCurrentText(project_option)
         self.on_plan_project_change(project_option)
 
         if schedule["activity_id"] is not None:
-            activities = self.db.list_activities(schedule["project_id"])
-            for activity in activities:
-                if activity["id"] == schedule["activity_id"]:
-                    option = self._activity_option(activity)
-                    self._ensure_combo_option(self.plan_activity_combo, option)
-                    self.plan_activity_combo.setCurrentText(option)
-                    break
+            option = schedule["activity_display"]
+            self._ensure_combo_option(self.plan_activity_combo, option)
+            self.plan_activity_combo.setCurrentText(option)
         else:
             self.plan_activity_combo.setCurrentText("(Tutta la commessa)")
 
@@ -2931,10 +3230,11 @@ class TimesheetWindow(QMainWindow):
         QMessageBox.information(self, "Programmazione", "Programmazione aggiornata.")
 
     def refresh_schedule_list(self) -> None:
-        if not hasattr(self, "plan_table"):
+        if self.plan_table is None:
             return
         self.plan_table.setRowCount(0)
         rows = self.db.list_schedules()
+        self._schedule_rows_by_id = {int(row["id"]): row for row in rows}
         for row in rows:
             idx = self.plan_table.rowCount()
             self.plan_table.insertRow(idx)
@@ -2970,15 +3270,14 @@ class TimesheetWindow(QMainWindow):
         if not schedule_id:
             QMessageBox.warning(self, "Programmazione", "Seleziona una programmazione.")
             return
-        schedules = self.db.list_schedules()
-        schedule = next((s for s in schedules if s["id"] == schedule_id), None)
+        schedule = self._schedule_rows_by_id.get(schedule_id)
         if not schedule:
             return
         current = schedule.get("status", "aperta")
         new_status = "chiusa" if current == "aperta" else "aperta"
         self.db.update_schedule_status(schedule_id, new_status)
         self.refresh_schedule_list()
-        if hasattr(self, "ts_client_combo"):
+        if self.ts_client_combo is not None:
             self.on_timesheet_client_change(self.ts_client_combo.currentText())
         self.refresh_control_panel()
 
@@ -3026,11 +3325,12 @@ class TimesheetWindow(QMainWindow):
         layout.addWidget(self.ctrl_tree, 1)
 
     def refresh_control_panel(self) -> None:
-        if not hasattr(self, "ctrl_tree"):
+        if self.ctrl_tree is None:
             return
-        self.ctrl_tree.clear()
         data = self.db.get_hierarchical_timesheet_data()
 
+        # L'albero viene costruito fuori dal widget e agganciato in un solo passaggio.
+        client_items: list[QTreeWidgetItem] = []
         for client in data:
             client_item = QTreeWidgetItem(
                 [
@@ -3051,8 +3351,8 @@ class TimesheetWindow(QMainWindow):
                     "",
                 ]
             )
-            client_item.setForeground(0, QColor("#4ea1ff"))
-            self.ctrl_tree.addTopLevelItem(client_item)
+            client_item.setForeground(0, self._CTRL_CLIENT_COLOR)
+            client_items.append(client_item)
 
             for project in client["projects"]:
                 is_closed = project.get("status") == "chiusa"
@@ -3076,7 +3376,7 @@ class TimesheetWindow(QMainWindow):
                         "",
                     ]
                 )
-                project_item.setForeground(0, QColor("#8f8f8f") if is_closed else QColor("#70b8ff"))
+                project_item.setForeground(0, self._CTRL_CLOSED_COLOR if is_closed else self._CTRL_PROJECT_COLOR)
                 client_item.addChild(project_item)
 
                 for activity in project["activities"]:
@@ -3101,7 +3401,7 @@ class TimesheetWindow(QMainWindow):
                             activity.get("schedule_note", "") or "",
                         ]
                     )
-                    activity_item.setForeground(0, QColor("#7ed6a8") if not activity_closed else QColor("#8f8f8f"))
+                    activity_item.setForeground(0, self._CTRL_CLOSED_COLOR if activity_closed else self._CTRL_ACTIVITY_COLOR)
                     project_item.addChild(activity_item)
 
                     for ts in activity["timesheets"]:
@@ -3124,10 +3424,13 @@ class TimesheetWindow(QMainWindow):
                                 ts.get("note", "") or "",
                             ]
                         )
-                        ts_item.setForeground(0, QColor("#9aa1af"))
+                        ts_item.setForeground(0, self._CTRL_TIMESHEET_COLOR)
                         activity_item.addChild(ts_item)
 
-        self.ctrl_tree.expandToDepth(0)
+        with _bulk_update(self.ctrl_tree):
+            self.ctrl_tree.clear()
+            self.ctrl_tree.addTopLevelItems(client_items)
+            self.ctrl_tree.expandToDepth(0)
 
     # Diario
     def build_diary_tab(self) -> None:
@@ -3229,7 +3532,7 @@ class TimesheetWindow(QMainWindow):
         self.diary_activity_combo.setCurrentIndex(0)
 
     def refresh_diary_data(self) -> None:
-        if not hasattr(self, "diary_table"):
+        if self.diary_table is None:
             return
 
         self.diary_table.setRowCount(0)
@@ -3276,12 +3579,7 @@ class TimesheetWindow(QMainWindow):
                 self.diary_table.setItem(idx, col, _readonly_item(value))
 
     def _format_date_display(self, date_str: str) -> str:
-        if not date_str:
-            return ""
-        try:
-            return datetime.strptime(date_str, "%Y-%m-%d").strftime("%d/%m/%Y")
-        except Exception:
-            return date_str
+        return _iso_to_ui_date(date_str)
 
     def update_diary_alert(self) -> None:
         count = self.db.count_pending_reminders()
@@ -3420,13 +3718,12 @@ class TimesheetWindow(QMainWindow):
         layout.addWidget(self.users_table, 1)
 
     def on_user_select(self) -> None:
-        if not self.is_admin or not hasattr(self, "users_table"):
+        if not self.is_admin or self.users_table is None:
             return
         user_id = self._selected_table_id(self.users_table)
         if not user_id:
             return
-        users = self.db.list_users(include_inactive=True)
-        selected = next((u for u in users if int(u["id"]) == user_id), None)
+        selected = self.db.get_user(user_id)
         if not selected:
             return
         self.tab_calendar_check.setChecked(bool(selected.get("tab_calendar", 1)))
@@ -3452,7 +3749,7 @@ class TimesheetWindow(QMainWindow):
             QMessageBox.critical(self, "Utenti", str(exc))
 
     def refresh_users_data(self) -> None:
-        if not self.is_admin or not hasattr(self, "users_table"):
+        if not self.is_admin or self.users_table is None:
             return
         users = self.db.list_users(include_inactive=True)
         self.users_table.setRowCount(0)
@@ -3503,8 +3800,7 @@ class TimesheetWindow(QMainWindow):
         if not user_id:
             QMessageBox.information(self, "Utenti", "Seleziona un utente dall'elenco.")
             return
-        users = self.db.list_users(include_inactive=True)
-        selected = next((u for u in users if int(u["id"]) == user_id), None)
+        selected = self.db.get_user(user_id)
         if not selected:
             return
 
@@ -3539,8 +3835,7 @@ class TimesheetWindow(QMainWindow):
         if user_id == int(self.current_user["id"]):
             QMessageBox.warning(self, "Utenti", "Non puoi disattivare il tuo utente.")
             return
-        users = self.db.list_users(include_inactive=True)
-        selected = next((u for u in users if int(u["id"]) == user_id), None)
+        selected = self.db.get_user(user_id)
         if not selected:
             return
         current_state = bool(selected["active"])
@@ -3561,29 +3856,43 @@ class TimesheetWindow(QMainWindow):
         QMessageBox.information(self, "Utenti", "Password aggiornata.")
 
     # Utility comuni
-    def refresh_master_data(self) -> None:
-        clients = self.db.list_clients()
-        client_values = [self._entity_option(c["id"], c["name"]) for c in clients]
+    def _apply_ts_client_values(self, combo: QComboBox, client_values: list[str]) -> None:
+        self._set_combo_values(combo, [""] + client_values)
+        self.on_timesheet_client_change(combo.currentText())
 
-        if hasattr(self, "ts_client_combo"):
-            self._set_combo_values(self.ts_client_combo, [""] + client_values)
-            self.on_timesheet_client_change(self.ts_client_combo.currentText())
-        if hasattr(self, "pm_client_combo"):
-            current = self.pm_client_combo.currentText()
-            self._set_combo_values(self.pm_client_combo, client_values)
-            if current in client_values:
-                self.pm_client_combo.setCurrentText(current)
-            self.refresh_projects_tree()
-            self.refresh_activities_tree()
-        if hasattr(self, "plan_project_combo"):
-            self.refresh_programming_options()
-        if hasattr(self, "diary_client_combo"):
-            self._diary_populate_combos()
-        self.refresh_day_entries()
-        self.refresh_schedule_list()
-        self.refresh_control_panel()
-        self.refresh_diary_data()
-        self.update_diary_alert()
+    def _apply_pm_client_values(self, combo: QComboBox, client_values: list[str]) -> None:
+        current = combo.currentText()
+        self._set_combo_values(combo, client_values)
+        if current in client_values:
+            combo.setCurrentText(current)
+        self.refresh_projects_tree()
+        self.refresh_activities_tree()
+
+    def refresh_master_data(self) -> None:
+        # Combo clienti presenti -> funzione che le aggiorna; la lista clienti è letta solo se serve.
+        client_combos = [
+            (combo, apply)
+            for combo, apply in (
+                (self.ts_client_combo, self._apply_ts_client_values),
+                (self.pm_client_combo, self._apply_pm_client_values),
+            )
+            if combo is not None
+        ]
+        # Tutte le letture in un'unica transazione.
+        with self.db.read_batch():
+            if client_combos:
+                client_values = [c["display"] for c in self.db.list_clients()]
+                for combo, apply in client_combos:
+                    apply(combo, client_values)
+            if self.plan_project_combo is not None:
+                self.refresh_programming_options()
+            if self.diary_client_combo is not None:
+                self._diary_populate_combos()
+            self.refresh_day_entries()
+            self.refresh_schedule_list()
+            self.refresh_control_panel()
+            self.refresh_diary_data()
+            self.update_diary_alert()
 
     def show_pdf_report_dialog(self) -> None:
         dlg = PDFReportDialog(self, self)